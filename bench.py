@@ -0,0 +1,57 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import sys
+import click
+
+from csssa2022.selections import network_opts_map, interaction_opts_map, simulation_opts_map
+from csssa2022.benchmark import BenchmarkSuite
+
+def names(value, choices):
+    selected = value.split(',')
+    unknown = [s for s in selected if s not in choices]
+    
+    if len(unknown) > 0:
+        raise click.BadParameter(f'unknown names {unknown}, choose from {list(choices)}')
+    
+    return selected
+
+@click.command()
+@click.option('--simulations', default=','.join(simulation_opts_map), help='Comma separated simulation types')
+@click.option('--interactions', default=','.join(interaction_opts_map), help='Comma separated interaction types')
+@click.option('--networks', default=','.join(network_opts_map), help='Comma separated network types')
+@click.option('--sizes', default='8,10,12,14,16', help='Comma separated log2 of the numbers of agents')
+@click.option('--steps', default=20, type=click.INT, help='Steps of every run')
+@click.option('--seed', default=0, type=click.INT, help='Seed of every run')
+@click.option('--snapshots', default=10, type=click.IntRange(min=1), help='Store the states of all agents every given number of steps')
+@click.option('--implicit', is_flag=True, help='Compute lattice, hypercube and complete neighbors instead of building graphs')
+@click.option('--compact-state', is_flag=True, help='Store opinions in one byte and f in single precision')
+@click.option('--timeout', default=600, type=click.INT, help='Seconds after which a case is stopped')
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='Save the results to this JSON file')
+@click.option('--baseline', default=None, type=click.Path(exists=True, dir_okay=False), help='Compare the results with this JSON file')
+@click.option('--tolerance', default=0.1, type=click.FLOAT, help='Relative slowdown reported as a regression')
+def main(simulations, interactions, networks, sizes, steps, seed, snapshots, implicit, compact_state, timeout,
+         output, baseline, tolerance):
+    cases = BenchmarkSuite.make_cases(names(simulations, simulation_opts_map),
+                                      names(interactions, interaction_opts_map),
+                                      names(networks, network_opts_map),
+                                      [int(k) for k in sizes.split(',')])
+    
+    suite = BenchmarkSuite(cases, max_steps=steps, seed=seed, snapshot_interval=snapshots, implicit=implicit,
+                           timeout=timeout, compact_state=compact_state)
+    results = suite.run()
+    
+    if output is not None:
+        BenchmarkSuite.save(results, output)
+    
+    if baseline is not None:
+        lines, regressed = BenchmarkSuite.compare(results, BenchmarkSuite.load(baseline), tolerance=tolerance)
+        print('\n'.join(lines))
+        
+        if regressed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -3,13 +3,34 @@
 # This program and the accompanying materials are made available under the
 # terms of the Mozilla Public License v2.0 which accompanies this distribution,
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
-from csssa2022.database import Database
+from csssa2022.storage import StorageBackend
+from csssa2022.database import Database, RowCollector
+from csssa2022.parquetstorage import ParquetStorage
 from csssa2022.record import Record
 from csssa2022.summary import Summary
-from csssa2022.selections import NetworkType, InteractionType, SimulationType
-from csssa2022.network import NetworkEnsembleFactory, NetworkUtil
+from csssa2022.snapshot import Snapshot
+from csssa2022.cycle import Cycle
+from csssa2022.selections import NetworkType, InteractionType, SimulationType, EngineType, BackendType, ConvergenceType
+from csssa2022.network import NetworkEnsembleFactory, NetworkUtil, NetworkCache, ImplicitTopology
 from csssa2022.dyadicmatrixvotermodel import DyadicMatrixVoterModel
+from csssa2022.dyadicsparsevotermodel import DyadicSparseVoterModel
 from csssa2022.higherordermatrixvotermodel import HigherOrderMatrixVoterModel
-from csssa2022.dyadicabmvotermodel import DyadicABMVoterModel
-from csssa2022.higherorderabmvotermodel import HigherOrderABMVoterModel
-from csssa2022.modeldriver import ModelDriver
\ No newline at end of file
+from csssa2022.higherordersparsevotermodel import HigherOrderSparseVoterModel
+from csssa2022.dyadicnativevotermodel import DyadicNativeVoterModel
+from csssa2022.higherordernativevotermodel import HigherOrderNativeVoterModel
+from csssa2022.scheduler import RandomSequentialScheduler
+from csssa2022.sparseensemble import DyadicSparseEnsemble
+from csssa2022.instrumentation import PhaseTimer, profile_call
+from csssa2022.benchmark import BenchmarkSuite, BenchmarkCase, BenchmarkResult
+from csssa2022.modeldriver import ModelDriver
+
+# The Mesa models are imported on first use, so that Mesa is only loaded when needed
+def __getattr__(name):
+    if name == 'DyadicABMVoterModel':
+        from csssa2022.dyadicabmvotermodel import DyadicABMVoterModel
+        return DyadicABMVoterModel
+    elif name == 'HigherOrderABMVoterModel':
+        from csssa2022.higherorderabmvotermodel import HigherOrderABMVoterModel
+        return HigherOrderABMVoterModel
+    
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
\ No newline at end of file
@@ -0,0 +1,65 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import random
+import numpy as np
+
+from networkx import Graph
+from csssa2022.abstractvotermodel import AbstractVoterModel
+
+
+class AbstractNativeVoterModel(AbstractVoterModel):
+    '''
+    Common agent store for the ABM engine without Mesa: opinions and values of f are
+    sequences indexed by agent id, and agents are updated one at a time, in place, as in the Mesa
+    models. Like a Mesa model, the model seeds its own generator from random before the
+    initial opinions are drawn, so both engines start from the same opinions.
+    
+    With kernels, steps run in the kernels of csssa2022.kernels, compiled when Numba is
+    installed, on typed stores and the CSR arrays. The kernels draw from the generators
+    exactly as the Python steps, so results are the same.
+    '''
+    def __init__(self, uuid_exp, ensemble_id, simtype, interactions, interactants,
+                 initial_state, network: Graph, n, max_steps, db, kernels=False, **kwargs):
+        self.random = random.Random(random.random())
+        
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=simtype,
+                         interactions=interactions,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        # We represent the agent store as sequences indexed by agent id, starting with a
+        # trivial value of f
+        self.kernels = kernels
+        self.agent_states, self.agent_fs = self.make_stores(typed=kernels)
+        
+        # The kernels update the stores in place through array views, and take empty
+        # adjacency arrays on the complete graph
+        if self.kernels:
+            self.state_array = np.frombuffer(self.agent_states, dtype=np.int8)
+            self.f_array = np.frombuffer(self.agent_fs, dtype=self.f_dtype)
+            
+            if self.mean_field:
+                self.kernel_csr = (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+            else:
+                self.kernel_csr = (self.indptr, self.indices)
+    
+    def get_opinion(self, i):
+        return self.agent_states[i]
+    
+    def get_f(self, i):
+        return self.agent_fs[i]
+    
+    def set_kernel_totals(self, total_yes):
+        '''
+        Replaces the running totals after a kernel step, the sum of f being exact
+        '''
+        self.set_totals(int(total_yes), self.agent_fs)
\ No newline at end of file
@@ -0,0 +1,65 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import math
+import random
+import numpy as np
+
+from networkx import Graph
+from csssa2022.abstractvotermodel import AbstractVoterModel
+
+
+class AbstractSparseVoterModel(AbstractVoterModel):
+    '''
+    Common agent store for the vectorized engines: opinions and values of f are arrays
+    indexed by agent id, and summaries are computed with array reductions.
+    '''
+    def __init__(self, uuid_exp, ensemble_id, simtype, interactions, interactants,
+                 initial_state, network: Graph, n, max_steps, db, **kwargs):
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=simtype,
+                         interactions=interactions,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        # Bulk random draws are seeded from the standard generator, so seeding random
+        # is enough to reproduce a run
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        
+        # We represent the agent store as arrays indexed by agent id
+        self.agent_states = np.zeros(self.n, dtype=np.int8)
+        self.agent_fs = np.zeros(self.n, dtype=self.f_dtype)
+        
+        self.agent_states[self.initial_yes] = 1
+    
+    def get_opinion(self, i):
+        return int(self.agent_states[i])
+    
+    def get_f(self, i):
+        return float(self.agent_fs[i])
+    
+    def opinion_vector(self):
+        return self.agent_states
+    
+    def f_vector(self):
+        return self.agent_fs
+    
+    def count_opinion(self, opinion):
+        return int(np.count_nonzero(self.agent_states == opinion))
+    
+    def sum_f(self):
+        # Exact, as the scalar models, so that both engines give the same summaries
+        return math.fsum(self.agent_fs.tolist())
+    
+    def recount_totals(self):
+        '''
+        Recomputes the running totals from the arrays, used when all agents are updated
+        '''
+        self.set_totals(self.count_opinion(1), self.agent_fs.tolist())
\ No newline at end of file
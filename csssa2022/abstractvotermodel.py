@@ -3,24 +3,41 @@
 # This program and the accompanying materials are made available under the
 # terms of the Mozilla Public License v2.0 which accompanies this distribution,
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import array
 import random
 import math
+import hashlib
+import itertools
+import numpy as np
 
 from networkx import Graph
 from abc import ABC, abstractmethod
-from operator import itemgetter
 from collections import deque
 
 from csssa2022.record import Record
 from csssa2022.summary import Summary
-from csssa2022.database import Database
+from csssa2022.snapshot import Snapshot
+from csssa2022.cycle import Cycle
+from csssa2022.selections import ConvergenceType, InteractionType
+from csssa2022.storage import StorageBackend
 from csssa2022.network import NetworkUtil
+from csssa2022.instrumentation import PhaseTimer
 
 
 class AbstractVoterModel(ABC):
     
+    # Whether a step only depends on the current state, so that a repeated state repeats
+    # forever, as in synchronous dyadic updates
+    deterministic = False
+    
+    # Number of past states compared by the fingerprint convergence test, i.e., the
+    # longest cycle detected
+    max_cycle = 8
+    
     def __init__(self, uuid_exp, ensemble_id, simtype, interactions, interactants,
-                 initial_state, network: Graph, n, max_steps, db: Database, **kwargs):
+                 initial_state, network: Graph, n, max_steps, db: StorageBackend,
+                 stop_on_convergence=False, snapshot_interval=None, timer: PhaseTimer = None,
+                 convergence: ConvergenceType = ConvergenceType.QUEUE, compact_state=False, **kwargs):
         # Constants
         self.f_threshold = 0.5
         
@@ -41,10 +58,29 @@ class AbstractVoterModel(ABC):
         self.n = n
         self.ensemble_id = ensemble_id
         
-        # Create agents, separate them into initial states of yes/no        
-        self.agent_list = list(range(0, self.n))
-        self.initial_yes = random.sample(self.agent_list, math.ceil(self.n*self.initial_state))    
-        self.initial_no = list(set(self.agent_list) - set(self.initial_yes))
+        # Whether agent stores hold one byte per opinion and single precision values of f,
+        # and agent ids are kept in int32 arrays instead of lists
+        self.compact_state = compact_state
+        self.f_dtype = np.float32 if compact_state else np.float64
+        
+        # Create agents, separate them into initial states of yes/no
+        if self.compact_state:
+            # The head of one random permutation holds the yes agents, drawn from a
+            # generator seeded from random
+            self.agent_list = range(0, self.n)
+            order = np.random.default_rng(random.getrandbits(64)).permutation(np.arange(0, self.n, dtype=np.int32))
+            m = math.ceil(self.n*self.initial_state)
+            self.initial_yes, self.initial_no = order[:m], order[m:]
+        else:
+            self.agent_list = list(range(0, self.n))
+            self.initial_yes = random.sample(self.agent_list, math.ceil(self.n*self.initial_state))    
+            self.initial_no = list(set(self.agent_list) - set(self.initial_yes))
+        
+        # Running totals behind the summaries, kept up to date by step, since all values
+        # of f start at 0. The sum of f is kept as exact partial sums, so incremental
+        # updates do not drift
+        self.total_yes = len(self.initial_yes)
+        self.f_partials = []
         
         # Set the database where to store elements
         self.db = db
@@ -52,15 +88,75 @@ class AbstractVoterModel(ABC):
         # Store the last summary to determine convergence
         self.last_summary = None
         
-        # We test convergence when all elements of the list are equal for 5 steps
+        # We test convergence when all elements of the list are equal for 5 steps, or, with
+        # the fingerprint test, when the states of the agents repeat
         self.convergence_queue = deque([], maxlen=5)
         self.converged = False
-              
-        # Obtain the respective id to node translators
-        self.n_to_node, self.node_to_n = NetworkUtil.make_rosetta(network)
+        self.convergence = convergence
+        self.fingerprints = deque([], maxlen=self.max_cycle)
+        
+        # Whether the run ends at convergence instead of repeating the last summary
+        # until max_steps
+        self.stop_on_convergence = stop_on_convergence
+        
+        # Whether the states of all agents are stored every snapshot_interval steps, along
+        # with the initial, converged and final states
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = None
+        
+        # Wall-clock time spent in each phase of the run
+        self.timer = PhaseTimer() if timer is None else timer
+        
+        # Obtain the integer adjacency used for all neighbor reads, the per-agent lists
+        # are only built for models that read neighbors one agent at a time. The complete
+        # graph needs no adjacency, its neighborhoods are the whole population. Agent ids
+        # are the positions of the nodes in the network, so no translation is kept
+        self.mean_field = NetworkUtil.is_complete(network)
+        self.neighbor_lists = None
+        
+        if self.mean_field:
+            self.indptr, self.indices = None, None
+            self.degree = np.full(self.n, self.n - 1, dtype=np.int32)
+        else:
+            with self.timer.phase('csr'):
+                self.indptr, self.indices, self.degree = NetworkUtil.make_csr(network)
         
     def agents(self):
         return list(self.agent_list)
+    
+    def make_store(self, typecode, typed=False):
+        '''
+        Returns a store of one zero per agent, indexed by agent id. Compact and typed stores
+        are typed arrays of the given array typecode, whose items are read as Python numbers,
+        and lists otherwise.
+        '''
+        if self.compact_state or typed:
+            return array.array(typecode, bytes(array.array(typecode).itemsize * self.n))
+        else:
+            return [0] * self.n
+    
+    def make_stores(self, typed=False):
+        '''
+        Returns the opinion and f stores of the agents, holding the initial opinions and
+        a trivial value of f. Typed stores without compact state hold f in double precision.
+        '''
+        states = self.make_store('b', typed)
+        
+        for i in self.initial_yes:
+            states[i] = 1
+        
+        return states, self.make_store('f' if self.compact_state else 'd', typed)
+    
+    def schedule_order(self, typed=False):
+        '''
+        Agent ids in the order they are added to a schedule, yes agents first
+        '''
+        if self.compact_state:
+            return array.array('i', np.concatenate((self.initial_yes, self.initial_no)).tobytes())
+        elif typed:
+            return array.array('i', self.initial_yes + self.initial_no)
+        else:
+            return self.initial_yes + self.initial_no
         
     @abstractmethod
     def step(self):
@@ -80,15 +176,38 @@ class AbstractVoterModel(ABC):
     
     def get_neighbors(self,i):
         '''
-        In this method, we make use of the node-id translation services constructed so far
+        In this method, we make use of the CSR adjacency constructed from the network. The
+        returned list is shared, so callers must not modify it.
         '''
-        node = self.n_to_node[i]
-        neighbors = self.network.neighbors(node)
+        if self.mean_field:
+            return list(range(0, i)) + list(range(i + 1, self.n))
+        
+        # Compact state reads neighborhoods from the CSR arrays instead of keeping a list
+        # per agent
+        if self.compact_state:
+            if self.neighbor_lists is None:
+                self.neighbor_lists = (memoryview(self.indptr), memoryview(self.indices))
+            
+            indptr, indices = self.neighbor_lists
+            
+            return indices[indptr[i]:indptr[i + 1]].tolist()
+        
+        if self.neighbor_lists is None:
+            self.neighbor_lists = [self.indices[self.indptr[j]:self.indptr[j + 1]].tolist() for j in range(0, self.n)]
         
-        if neighbors is None:
-            neighbors = []
+        return self.neighbor_lists[i]
+    
+    def make_partition(self, c, interactants):
+        '''
+        Returns the partition of centroid c, i.e., its neighbors followed by itself. On the
+        complete graph, the subset of interactants is drawn directly with the same random
+        draws as sampling the full partition, which is never built.
+        '''
+        if not self.mean_field or self.n <= interactants:
+            return self.get_neighbors(c) + [c]
         else:
-            return list(itemgetter(*neighbors)(self.node_to_n))
+            # Position j is the j-th agent other than c, the last position is c itself
+            return [j + (j >= c) if j < self.n - 1 else c for j in random.sample(range(0, self.n), interactants)]
     
     def agent_to_record(self, i):
         return Record(self.uuid_exp,
@@ -98,6 +217,19 @@ class AbstractVoterModel(ABC):
                       self.get_opinion(i),
                       self.get_f(i))
     
+    def opinion_vector(self):
+        return np.asarray(self.agent_states, dtype=np.int8)
+    
+    def f_vector(self):
+        return np.asarray(self.agent_fs, dtype=self.f_dtype)
+    
+    def step_to_snapshot(self):
+        return Snapshot.from_arrays(self.uuid_exp,
+                                    self.ensemble_id,
+                                    self.stepno,
+                                    self.opinion_vector(),
+                                    self.f_vector())
+    
     def step_to_summary(self):
         if self.converged:
             self.last_summary.stepno = self.stepno
@@ -117,13 +249,66 @@ class AbstractVoterModel(ABC):
             
         return self.last_summary
     
+    def update_totals(self, old_opinion, new_opinion, old_f, new_f):
+        '''
+        Updates the running totals after a single agent changed its opinion and f
+        '''
+        self.total_yes += new_opinion - old_opinion
+        self.add_f(new_f)
+        self.add_f(-old_f)
+    
+    def set_totals(self, total_yes, fs):
+        '''
+        Replaces the running totals, used when all agents are updated at once. The partials
+        are rebuilt from the values of f themselves, so later updates stay exact
+        '''
+        self.total_yes = total_yes
+        self.f_partials = []
+        self.add_fs(fs)
+    
+    def add_f(self, x):
+        '''
+        Adds x to the sum of f without rounding, keeping non-overlapping partials as in
+        math.fsum (Shewchuk's algorithm)
+        '''
+        i = 0
+        
+        for y in self.f_partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                self.f_partials[i] = lo
+                i += 1
+            x = hi
+            
+        self.f_partials[i:] = [x]
+    
+    def add_fs(self, values):
+        '''
+        Adds a sequence of values to the sum of f without rounding. Their exact sum is split
+        into non-overlapping parts by repeated math.fsum of the remainder, so that a large
+        update costs a few C loops instead of one add_f per value.
+        '''
+        parts = []
+        part = math.fsum(values)
+        
+        while part:
+            parts.append(-part)
+            self.add_f(part)
+            part = math.fsum(itertools.chain(values, parts))
+    
     def count_yes(self):
-        return self.count_opinion(1)
+        return self.total_yes
         
     def count_no(self):
-        return self.count_opinion(0)
+        return self.n - self.total_yes
     
     def count_opinion(self, opinion):
+        '''
+        Counts agents by scanning the population, the summaries rely on the running totals
+        '''
         total = 0
         
         for i in self.agent_list:
@@ -133,12 +318,18 @@ class AbstractVoterModel(ABC):
         return total
     
     def average_f(self):
+        return math.fsum(self.f_partials)/self.n
+    
+    def sum_f(self):
+        '''
+        Sums f by scanning the population, the summaries rely on the running totals
+        '''
         total = 0
         
         for i in self.agent_list:
             total += self.get_f(i)
                 
-        return total/self.n
+        return total
     
     def save(self, i):
         self.db.insert_record(self.agent_to_record(i))
@@ -148,26 +339,121 @@ class AbstractVoterModel(ABC):
         Save all takes all agents and, depending on the implementation of agent_to_record,
         takes care of saving one full iteration. Commit occurs at the end of the simulation
         '''
-        self.db.insert_summary(self.step_to_summary())
+        with self.timer.phase('summary'):
+            summary = self.step_to_summary()
+        
+        with self.timer.phase('insert'):
+            self.db.insert_summary(summary)
+        
+        # Converged states are saved once, when convergence is detected
+        if self.snapshot_interval is not None and not(self.converged):
+            if self.last_snapshot is None or self.stepno == self.max_steps or \
+                    (self.stepno % self.snapshot_interval == 0 and self.stepno != self.last_snapshot):
+                self.save_snapshot()
+    
+    def save_snapshot(self):
+        with self.timer.phase('snapshot'):
+            self.db.insert_snapshot(self.step_to_snapshot())
+        
+        self.last_snapshot = self.stepno
 
     def test_convergence(self):
         '''
         Test convergence and avoid extra computation for the rest of simulation time
         '''
-        self.converged = (len(set(self.convergence_queue)) == 1) and (len(self.convergence_queue) == 5)
+        if self.convergence == ConvergenceType.FINGERPRINT:
+            self.test_fingerprint()
+        else:
+            self.converged = (len(set(self.convergence_queue)) == 1) and (len(self.convergence_queue) == 5)
+    
+    def fingerprint(self):
+        '''
+        Hash of the packed opinions and the values of f of all agents
+        '''
+        digest = hashlib.blake2b(np.packbits(self.opinion_vector() != 0).tobytes(), digest_size=16)
+        digest.update(np.ascontiguousarray(self.f_vector(), dtype=np.float64).tobytes())
+        
+        return digest.digest()
+    
+    def test_fingerprint(self):
+        '''
+        Compares the state of the agents with the states of the previous steps. Deterministic
+        models repeat an earlier state forever, so any match is a fixed point or a cycle. In
+        other models, only a state repeated in consecutive steps that no update can change
+        is final. The length of the cycle is stored when it is found.
+        '''
+        fingerprint = self.fingerprint()
+        
+        if fingerprint in self.fingerprints:
+            length = len(self.fingerprints) - self.fingerprints.index(fingerprint)
+            
+            if self.deterministic or (length == 1 and self.is_absorbing()):
+                self.converged = True
+                self.db.insert_cycle(Cycle(self.uuid_exp, self.ensemble_id, self.stepno, length))
+                
+        self.fingerprints.append(fingerprint)
+    
+    def is_absorbing(self):
+        '''
+        Whether no update can change the current state. A dyadic update sets the f of an
+        agent to its fraction of yes neighbors, so every f must already have that value. A
+        group update sets the group drawn from a neighborhood to its fraction of yes
+        opinions, so every neighborhood must agree and every f must equal the opinion.
+        '''
+        opinions = self.opinion_vector().astype(np.int64)
+        fs = self.f_vector()
+        
+        if self.interactions == InteractionType.DYADIC:
+            if self.mean_field:
+                yes = opinions.sum() - opinions
+            else:
+                yes = np.bincount(np.repeat(np.arange(0, self.n), self.degree), weights=opinions[self.indices],
+                                  minlength=self.n)
+            
+            f = np.divide(yes, self.degree, out=np.zeros(self.n), where=self.degree > 0)
+            
+            return np.array_equal(f.astype(self.f_dtype), fs) and np.array_equal(opinions, f > self.f_threshold)
+        else:
+            if self.mean_field:
+                agree = (opinions == opinions[0]).all()
+            else:
+                agree = np.array_equal(opinions[self.indices], np.repeat(opinions, self.degree))
+            
+            return agree and np.array_equal(fs, opinions)
 
     def run(self):
         while self.running:
-            # Perform the step if not converged
-            if not(self.converged):
-                self.step()
+            self.advance()
+            
+    def advance(self, stepped=False):
+        '''
+        Performs one iteration of the simulation loop. When the step has already been
+        computed elsewhere (e.g., for a whole ensemble at once), stepped skips it.
+        '''
+        # Perform the step if not converged
+        if not(self.converged):
+            if not(stepped):
+                with self.timer.phase('step'):
+                    self.step()
+            
+            # The step after the last one only stops the run, and the unchanged state must
+            # not count as a repetition
+            if self.running:
                 self.test_convergence()
-            else:
-                if self.stepno == self.max_steps:
-                    self.running = False
             
-            # Save all agent states
-            self.save_all()
+            if self.converged and self.snapshot_interval is not None:
+                self.save_snapshot()
             
-             # Update the step counter
-            self.stepno += 1
\ No newline at end of file
+            # The converged state was saved in the previous iteration, so we are done
+            if self.converged and self.stop_on_convergence:
+                self.running = False
+                return
+        else:
+            if self.stepno == self.max_steps:
+                self.running = False
+        
+        # Save all agent states
+        self.save_all()
+        
+         # Update the step counter
+        self.stepno += 1
\ No newline at end of file
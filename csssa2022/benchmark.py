@@ -0,0 +1,247 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import os
+import json
+import random
+import shutil
+import hashlib
+import resource
+import tempfile
+import itertools
+
+from dataclasses import dataclass, asdict
+from csssa2022.database import Database
+from csssa2022.network import NetworkEnsembleFactory
+from csssa2022.modeldriver import ModelDriver
+from csssa2022.instrumentation import PhaseTimer
+from csssa2022.selections import network_opts_map, interaction_opts_map, simulation_opts_map, engine_opts_map
+
+
+@dataclass
+class BenchmarkCase:
+    '''
+    Class that represents one benchmarked configuration, named as the arguments of main.py
+    '''
+    simulation: str
+    interaction: str
+    network: str
+    n: int
+    
+    def key(self):
+        return f'{self.simulation}/{self.interaction}/{self.network}/{self.n}'
+
+
+@dataclass
+class BenchmarkResult:
+    '''
+    Class that represents the measurements of one case. Agent updates are n per computed
+    step, and database rows are the summaries and snapshots written by the model. Peak
+    memory is the growth of the peak resident memory of the case process while running
+    the case, as a forked process starts with the resident memory of its parent.
+    '''
+    key: str
+    status: str
+    steps: int = 0
+    setup_seconds: float = 0.0
+    step_seconds: float = 0.0
+    steps_per_second: float = 0.0
+    updates_per_second: float = 0.0
+    peak_memory_mb: float = 0.0
+    db_rows: int = 0
+    db_seconds: float = 0.0
+    db_rows_per_second: float = 0.0
+    checksum: str = None
+
+
+class BenchmarkSuite:
+    '''
+    This class runs every model on every topology over a range of population sizes with
+    fixed seeds. Each case runs in a fresh process, so peak memory is its own and a case
+    exceeding the timeout is stopped. Results are saved as JSON and compared against a
+    saved baseline, including a checksum of the summaries so that changes in results are
+    caught along with changes in speed.
+    '''
+    
+    # Number of interactants of each interaction type
+    interactants = {'dyn': 2, 'hord': 3}
+    
+    # Edges above which an explicit complete graph is not built
+    max_edges = 1 << 26
+    
+    def __init__(self, cases: list, max_steps=20, seed=0, initial_state=0.5, snapshot_interval=10,
+                 implicit=False, timeout=600, compact_state=False):
+        self.cases = cases
+        self.max_steps = max_steps
+        self.seed = seed
+        self.initial_state = initial_state
+        self.snapshot_interval = snapshot_interval
+        self.implicit = implicit
+        self.timeout = timeout
+        self.compact_state = compact_state
+    
+    @staticmethod
+    def make_cases(simulations, interactions, networks, sizes):
+        '''
+        Cases of the cartesian product of the given names and log2 population sizes
+        '''
+        return [BenchmarkCase(s, i, nt, 2**k) for s, i, nt, k in itertools.product(simulations, interactions, networks, sizes)]
+    
+    def run_case(self, case: BenchmarkCase):
+        '''
+        Runs one case in the current process, storing its outputs in a temporary database
+        '''
+        baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        directory = tempfile.mkdtemp(prefix='csssa2022-bench-')
+        timer = PhaseTimer()
+        network_seed, model_seed = ModelDriver.make_seeds(self.seed, 1)[0]
+        
+        try:
+            db = Database(os.path.join(directory, 'bench.db'))
+            db.connect()
+            
+            with timer.phase('network'):
+                net = NetworkEnsembleFactory(implicit=self.implicit).make_member(case.n, network_opts_map[case.network],
+                                                                                  seed=network_seed)
+            
+            random.seed(model_seed)
+            
+            with timer.phase('setup'):
+                model = ModelDriver.make_model(simulation_opts_map[case.simulation],
+                                               interaction_opts_map[case.interaction],
+                                               engine_opts_map[case.simulation], case.key(), 0,
+                                               self.interactants[case.interaction], self.initial_state,
+                                               net, case.n, self.max_steps, db,
+                                               snapshot_interval=self.snapshot_interval,
+                                               compact_state=self.compact_state, timer=timer)
+            
+            model.save_all()
+            model.run()
+            
+            with timer.phase('commit'):
+                db.checkpoint()
+            
+            # Fingerprint of the outcomes, independent of timing
+            digest = hashlib.sha1()
+            
+            for s in db.read_summaries(case.key(), filled=False):
+                digest.update(repr((s.step_id, s.total_yes, s.total_no, s.avg_f, s.conv_step)).encode())
+            
+            db.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        
+        # A run that did not converge ends with a call to step that only stops it
+        steps = timer.phases.get('step', [0.0, 0])[1] - (0 if model.converged else 1)
+        step_seconds = timer.seconds('step')
+        db_rows = timer.phases.get('insert', [0.0, 0])[1] + timer.phases.get('snapshot', [0.0, 0])[1]
+        db_seconds = timer.seconds('insert') + timer.seconds('snapshot') + timer.seconds('commit')
+        
+        return BenchmarkResult(case.key(),
+                               'ok',
+                               steps,
+                               timer.seconds('network') + timer.seconds('setup'),
+                               step_seconds,
+                               steps / step_seconds if step_seconds > 0 else 0.0,
+                               case.n * steps / step_seconds if step_seconds > 0 else 0.0,
+                               (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+                               db_rows,
+                               db_seconds,
+                               db_rows / db_seconds if db_seconds > 0 else 0.0,
+                               digest.hexdigest())
+    
+    def run_isolated(self, case: BenchmarkCase, connection):
+        try:
+            connection.send(self.run_case(case))
+        except Exception as e:
+            connection.send(BenchmarkResult(case.key(), f'error: {type(e).__name__}: {e}'))
+        finally:
+            connection.close()
+    
+    def run(self, report=print):
+        '''
+        Runs every case in its own process and returns the results in the order of the cases
+        '''
+        context = ModelDriver.pool_context()
+        results = []
+        
+        for case in self.cases:
+            n_edges = case.n * (case.n - 1) // 2
+            
+            if case.network == 'k_n' and not(self.implicit) and n_edges > self.max_edges:
+                result = BenchmarkResult(case.key(), 'skipped: complete graph too large, use implicit topologies')
+            else:
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=self.run_isolated, args=(case, sender))
+                process.start()
+                sender.close()
+                
+                if receiver.poll(self.timeout):
+                    result = receiver.recv()
+                else:
+                    result = BenchmarkResult(case.key(), 'timeout')
+                
+                if process.is_alive():
+                    process.kill()
+                
+                process.join()
+            
+            results.append(result)
+            report(BenchmarkSuite.format(result))
+        
+        return results
+    
+    @staticmethod
+    def format(result: BenchmarkResult):
+        if result.status != 'ok':
+            return f'{result.key:<32} {result.status}'
+        
+        return (f'{result.key:<32} {result.steps_per_second:12.1f} steps/s {result.updates_per_second:14.0f} updates/s '
+                f'{result.peak_memory_mb:9.1f} MB {result.db_rows_per_second:12.0f} rows/s')
+    
+    @staticmethod
+    def save(results: list, path):
+        with open(path, 'w') as f:
+            json.dump([asdict(r) for r in results], f, indent=1)
+    
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return [BenchmarkResult(**r) for r in json.load(f)]
+    
+    @staticmethod
+    def compare(results: list, baseline: list, tolerance=0.1):
+        '''
+        Compares results with a baseline case by case. Returns the report lines and whether
+        any case got slower than the tolerance allows or changed its results.
+        '''
+        previous = {r.key: r for r in baseline}
+        lines = []
+        regressed = False
+        
+        for r in results:
+            b = previous.get(r.key)
+            
+            if b is None or r.status != 'ok' or b.status != 'ok':
+                lines.append(f'{r.key:<32} not comparable ({r.status} vs {"missing" if b is None else b.status})')
+                continue
+            
+            speedup = r.steps_per_second / b.steps_per_second if b.steps_per_second > 0 else float('inf')
+            memory = r.peak_memory_mb / b.peak_memory_mb if b.peak_memory_mb > 0 else float('inf')
+            db = r.db_rows_per_second / b.db_rows_per_second if b.db_rows_per_second > 0 else float('inf')
+            notes = []
+            
+            if speedup < 1 - tolerance:
+                notes.append('SLOWER')
+            elif speedup > 1 + tolerance:
+                notes.append('faster')
+            
+            if r.checksum != b.checksum:
+                notes.append('RESULTS DIFFER')
+            
+            regressed = regressed or speedup < 1 - tolerance or r.checksum != b.checksum
+            lines.append(f'{r.key:<32} steps x{speedup:6.2f} memory x{memory:6.2f} db x{db:6.2f} {" ".join(notes)}')
+        
+        return lines, regressed
\ No newline at end of file
@@ -0,0 +1,17 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+from dataclasses import dataclass
+
+@dataclass
+class Cycle:
+    '''
+    Class that records the step at which a run was found to repeat its states, and the
+    length of the repeated cycle, 1 for a fixed point.
+    '''
+    uuid_exp: str
+    ensemble_id: int
+    step_id: int
+    length: int
\ No newline at end of file
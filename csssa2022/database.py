@@ -8,11 +8,15 @@ from pathlib import Path
 from csssa2022.record import Record
 from csssa2022.simulation import Simulation
 from csssa2022.summary import Summary
+from csssa2022.snapshot import Snapshot
+from csssa2022.cycle import Cycle
+from csssa2022.storage import StorageBackend
 
 
-class Database:
+class Database(StorageBackend):
     '''
-    The database class takes care of storing simulation information.
+    The database class takes care of storing simulation information in SQLite, the
+    default storage backend.
     '''
     
     __simulations_sql = '''
@@ -54,26 +58,151 @@ class Database:
         conv_step integer
     )
     '''
+    
+    # Ensemble points whose rows are complete, committed together with their last rows
+    __members_sql = '''
+    CREATE TABLE IF NOT EXISTS members
+    (
+        uuid_exp text,
+        ensemble_id integer
+    )
+    '''
+    
+    # Sampled states of all agents, see Snapshot
+    __snapshots_sql = '''
+    CREATE TABLE IF NOT EXISTS snapshots
+    (
+        uuid_exp text,
+        ensemble_id integer,
+        step_id integer,
+        n integer,
+        opinions blob,
+        f_vals blob
+    )
+    '''
+    
+    # Steps at which runs repeated their states, see Cycle
+    __cycles_sql = '''
+    CREATE TABLE IF NOT EXISTS cycles
+    (
+        uuid_exp text,
+        ensemble_id integer,
+        step_id integer,
+        length integer
+    )
+    '''
+    
+    # Aggregates behind the analysis, see materialize
+    __step_stats_sql = '''
+    CREATE TABLE IF NOT EXISTS step_stats
+    (
+        uuid_exp text,
+        step_id integer,
+        n_rows integer,
+        sum_avg_f real
+    )
+    '''
+    
+    __member_convergence_sql = '''
+    CREATE TABLE IF NOT EXISTS member_convergence
+    (
+        uuid_exp text,
+        ensemble_id integer,
+        conv_step integer,
+        total_yes integer,
+        total_no integer,
+        avg_f real
+    )
+    '''
+    
+    # Step 0 is saved twice per run, so keys over summaries cannot be unique
+    __indexes_sql = [
+        'CREATE INDEX IF NOT EXISTS simulations_uuid ON simulations (uuid_exp)',
+        'CREATE INDEX IF NOT EXISTS simulations_parameters ON simulations '
+        '(simulation_type, interaction_type, network_type, n, interactants, initial_state)',
+        'CREATE INDEX IF NOT EXISTS records_key ON records (uuid_exp, ensemble_id, step_id)',
+        'CREATE INDEX IF NOT EXISTS summaries_key ON summaries (uuid_exp, ensemble_id, step_id)',
+        'CREATE INDEX IF NOT EXISTS members_key ON members (uuid_exp, ensemble_id)',
+        'CREATE INDEX IF NOT EXISTS snapshots_key ON snapshots (uuid_exp, ensemble_id, step_id)',
+        'CREATE INDEX IF NOT EXISTS cycles_key ON cycles (uuid_exp, ensemble_id)',
+        'CREATE INDEX IF NOT EXISTS step_stats_key ON step_stats (uuid_exp, step_id)',
+        'CREATE INDEX IF NOT EXISTS member_convergence_key ON member_convergence (uuid_exp, ensemble_id)'
+    ]
+    
+    # Summaries with the series of every run padded up to max_steps with its last
+    # summary, which is what runs stopped at convergence leave out
+    __summaries_filled_sql = '''
+    CREATE VIEW IF NOT EXISTS summaries_filled AS
+    WITH RECURSIVE last_rows AS (
+        SELECT MAX(rowid) AS last_id FROM summaries GROUP BY uuid_exp, ensemble_id
+    ),
+    fill(uuid_exp, ensemble_id, step_id, total_yes, total_no, avg_f, conv_step, max_steps) AS (
+        SELECT s.uuid_exp, s.ensemble_id, s.step_id + 1, s.total_yes, s.total_no, s.avg_f,
+               s.conv_step, CAST(sim.max_steps AS integer)
+        FROM summaries s
+        JOIN last_rows l ON s.rowid = l.last_id
+        JOIN simulations sim ON sim.uuid_exp = s.uuid_exp
+        WHERE s.step_id < CAST(sim.max_steps AS integer)
+        UNION ALL
+        SELECT uuid_exp, ensemble_id, step_id + 1, total_yes, total_no, avg_f, conv_step, max_steps
+        FROM fill
+        WHERE step_id < max_steps
+    )
+    SELECT uuid_exp, ensemble_id, step_id, total_yes, total_no, avg_f, conv_step FROM summaries
+    UNION ALL
+    SELECT uuid_exp, ensemble_id, step_id, total_yes, total_no, avg_f, conv_step FROM fill
+    '''
      
-    def __init__(self, filename):
+    def __init__(self, filename, batch_size=10000, durable=False):
+        '''
+        Rows are buffered in memory and written with executemany once batch_size rows are
+        queued, and at every checkpoint. A durable database instead writes and commits
+        every row as it is inserted.
+        '''
         self.filename = filename
         self.exists = Path(self.filename).is_file()
         self.con = None
         self.cur = None
         
+        self.batch_size = batch_size
+        self.durable = durable
+        self.records = []
+        self.summaries = []
+        self.snapshots = []
+        self.cycles = []
+        
     def connect(self):
         self.con = sqlite3.connect(self.filename)
         self.cur = self.con.cursor()
         
+        # The page size only applies to new databases and must precede WAL journaling
+        if not(self.exists):
+            self.cur.execute('pragma page_size = 8192')
+        
+        self.cur.execute('pragma journal_mode = WAL')
+        self.cur.execute('pragma synchronous = ' + ('FULL' if self.durable else 'NORMAL'))
+        self.cur.execute('pragma cache_size = -65536')
+        self.cur.execute('pragma temp_store = MEMORY')
+        
         if not(self.exists):
             self.cur.execute(self.__simulations_sql)
             self.cur.execute(self.__records_sql)
             self.cur.execute(self.__summaries_sql)
             self.con.commit()
+            
+        self.cur.execute(self.__members_sql)
+        self.cur.execute(self.__snapshots_sql)
+        self.cur.execute(self.__cycles_sql)
+        self.cur.execute(self.__step_stats_sql)
+        self.cur.execute(self.__member_convergence_sql)
+        self.cur.execute(self.__summaries_filled_sql)
+        
+        for sql in self.__indexes_sql:
+            self.cur.execute(sql)
+        self.con.commit()
     
     def insert_record(self, r: Record):
-        self.cur.execute('insert into records values (?, ?, ?, ?, ?, ?)',
-                         (
+        self.records.append((
                              r.uuid_exp,
                              r.ensemble_id,
                              r.step_id,
@@ -81,10 +210,10 @@ class Database:
                              r.opinion,
                              r.f_val
                         ))
+        self.queued()
         
     def insert_summary(self, s: Summary):
-        self.cur.execute('insert into summaries values (?, ?, ?, ?, ?, ?, ?)',
-                         (
+        self.summaries.append((
                              s.uuid_exp,
                              s.ensemble_id,
                              s.step_id,
@@ -93,6 +222,57 @@ class Database:
                              s.avg_f,
                              s.conv_step
                         ))
+        self.queued()
+        
+    def insert_snapshot(self, s: Snapshot):
+        self.snapshots.append((
+                             s.uuid_exp,
+                             s.ensemble_id,
+                             s.step_id,
+                             s.n,
+                             s.opinions,
+                             s.f_vals
+                        ))
+        self.queued()
+        
+    def insert_cycle(self, c: Cycle):
+        self.cycles.append((
+                             c.uuid_exp,
+                             c.ensemble_id,
+                             c.step_id,
+                             c.length
+                        ))
+        self.queued()
+        
+    def queued(self):
+        '''
+        Decides whether queued rows must be written after an insertion
+        '''
+        if self.durable:
+            self.flush()
+            self.con.commit()
+        elif len(self.records) + len(self.summaries) + len(self.snapshots) + len(self.cycles) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        '''
+        Writes all queued rows, they become durable at the next commit
+        '''
+        if len(self.records) > 0:
+            self.cur.executemany('insert into records values (?, ?, ?, ?, ?, ?)', self.records)
+            self.records = []
+            
+        if len(self.summaries) > 0:
+            self.cur.executemany('insert into summaries values (?, ?, ?, ?, ?, ?, ?)', self.summaries)
+            self.summaries = []
+            
+        if len(self.snapshots) > 0:
+            self.cur.executemany('insert into snapshots values (?, ?, ?, ?, ?, ?)', self.snapshots)
+            self.snapshots = []
+            
+        if len(self.cycles) > 0:
+            self.cur.executemany('insert into cycles values (?, ?, ?, ?)', self.cycles)
+            self.cycles = []
         
     def insert_simulation(self, s: Simulation):
         self.cur.execute('insert into simulations values (?, ?, ?, ?, ?, ?, ?, ?, ?)',
@@ -108,13 +288,165 @@ class Database:
                              s.max_steps
                          ))
 
+    def insert_member(self, uuid_exp, ensemble_id):
+        '''
+        Marks an ensemble point as complete. The mark is written after all queued rows, so
+        it only becomes durable together with them.
+        '''
+        self.flush()
+        self.cur.execute('insert into members values (?, ?)', (uuid_exp, ensemble_id))
+        
+    def has_simulation(self, uuid_exp):
+        return self.cur.execute('select 1 from simulations where uuid_exp = ?', (uuid_exp,)).fetchone() is not None
+    
+    def read_members(self, uuid_exp):
+        '''
+        Reads the ids of the complete ensemble points of an experiment
+        '''
+        rows = self.cur.execute('select ensemble_id from members where uuid_exp = ?', (uuid_exp,))
+        
+        return set(row[0] for row in rows)
+    
+    def discard_incomplete(self, uuid_exp):
+        '''
+        Deletes the rows of ensemble points that were interrupted before completion, which
+        only durable databases may hold
+        '''
+        for table in ['records', 'summaries', 'snapshots', 'cycles']:
+            self.cur.execute(f'delete from {table} where uuid_exp = ? and ensemble_id not in '
+                             '(select ensemble_id from members where uuid_exp = ?)', (uuid_exp, uuid_exp))
+        self.con.commit()
+    
+    def read_summaries(self, uuid_exp, filled=True):
+        '''
+        Reads the summaries of an experiment ordered by ensemble point and step. With filled,
+        every ensemble point has a summary for each step up to max_steps.
+        '''
+        self.flush()
+        
+        table = 'summaries_filled' if filled else 'summaries'
+        rows = self.cur.execute(f'select * from {table} where uuid_exp = ? order by ensemble_id, step_id',
+                                (uuid_exp,))
+        
+        return [Summary(*row) for row in rows]
+    
+    def read_snapshots(self, uuid_exp, ensemble_id=None):
+        '''
+        Reads the snapshots of an experiment, or of one of its ensemble points, ordered by
+        ensemble point and step. Snapshot.opinion_array and Snapshot.f_array decode them.
+        '''
+        self.flush()
+        
+        if ensemble_id is None:
+            rows = self.cur.execute('select * from snapshots where uuid_exp = ? order by ensemble_id, step_id',
+                                    (uuid_exp,))
+        else:
+            rows = self.cur.execute('select * from snapshots where uuid_exp = ? and ensemble_id = ? order by step_id',
+                                    (uuid_exp, ensemble_id))
+        
+        return [Snapshot(*row) for row in rows]
+    
+    def read_cycles(self, uuid_exp):
+        '''
+        Reads the cycles of the ensemble points of an experiment that repeated their states
+        '''
+        self.flush()
+        
+        rows = self.cur.execute('select * from cycles where uuid_exp = ? order by ensemble_id', (uuid_exp,))
+        
+        return [Cycle(*row) for row in rows]
+    
+    def materialize(self, uuid_exp):
+        '''
+        Rebuilds the aggregates of an experiment used by the analysis. Summaries are
+        deduplicated as stored, without padding, so that step_stats holds their count and
+        sum of avg_f per step and member_convergence holds the summaries of every ensemble
+        point at its largest conv_step, as analysis.R computed them from the summaries.
+        '''
+        self.flush()
+        
+        rows = self.cur.execute('select ensemble_id, step_id, total_yes, total_no, avg_f, conv_step '
+                                'from summaries where uuid_exp = ? order by rowid', (uuid_exp,)).fetchall()
+        
+        # Distinct rows in insertion order
+        distinct = list(dict.fromkeys(rows))
+        step_stats = {}
+        conv_steps = {}
+        
+        for ensemble_id, step_id, total_yes, total_no, avg_f, conv_step in distinct:
+            n_rows, sum_avg_f = step_stats.get(step_id, (0, 0.0))
+            step_stats[step_id] = (n_rows + 1, sum_avg_f + avg_f)
+            conv_steps[ensemble_id] = max(conv_step, conv_steps.get(ensemble_id, conv_step))
+            
+        self.cur.execute('delete from step_stats where uuid_exp = ?', (uuid_exp,))
+        self.cur.execute('delete from member_convergence where uuid_exp = ?', (uuid_exp,))
+        self.cur.executemany('insert into step_stats values (?, ?, ?, ?)',
+                             [(uuid_exp, s, n_rows, sum_avg_f) for s, (n_rows, sum_avg_f) in sorted(step_stats.items())])
+        self.cur.executemany('insert into member_convergence values (?, ?, ?, ?, ?, ?)',
+                             [(uuid_exp, e, s, total_yes, total_no, avg_f)
+                              for e, s, total_yes, total_no, avg_f, _ in distinct if s == conv_steps[e]])
+        self.con.commit()
+    
+    def materialize_all(self, rebuild=False):
+        '''
+        Materializes the aggregates of every experiment, or only of those without them
+        '''
+        if rebuild:
+            uuids = self.cur.execute('select distinct uuid_exp from simulations').fetchall()
+        else:
+            uuids = self.cur.execute('select distinct uuid_exp from simulations where uuid_exp not in '
+                                     '(select uuid_exp from step_stats)').fetchall()
+        
+        for (uuid_exp,) in uuids:
+            self.materialize(uuid_exp)
+    
     def checkpoint(self):
         '''
         This function makes explicit when to send information to disk. For efficiecy,
         we want this associated per ensemble_id.
         '''
+        self.flush()
         self.con.commit()
 
     def close(self):
+        self.flush()
         self.con.commit()
-        self.con.close()
\ No newline at end of file
+        self.con.close()
+        
+        
+class RowCollector:
+    '''
+    Stands in for a storage backend where rows cannot be written directly, e.g., in worker
+    processes. Rows are kept in memory and later inserted by the process owning the database.
+    '''
+    
+    def __init__(self):
+        self.records = []
+        self.summaries = []
+        self.snapshots = []
+        self.cycles = []
+        
+    def insert_record(self, r: Record):
+        self.records.append(r)
+        
+    def insert_summary(self, s: Summary):
+        self.summaries.append(s)
+        
+    def insert_snapshot(self, s: Snapshot):
+        self.snapshots.append(s)
+        
+    def insert_cycle(self, c: Cycle):
+        self.cycles.append(c)
+        
+    def write(self, db: StorageBackend):
+        for r in self.records:
+            db.insert_record(r)
+            
+        for s in self.summaries:
+            db.insert_summary(s)
+            
+        for s in self.snapshots:
+            db.insert_snapshot(s)
+            
+        for c in self.cycles:
+            db.insert_cycle(c)
\ No newline at end of file
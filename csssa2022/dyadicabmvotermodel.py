@@ -11,35 +11,67 @@ from mesa.time import RandomActivation
 
 
 class DyadicABMVoterAgent(Agent):
+    '''
+    The opinion and f of an agent are held in the agent store of the model, by agent id
+    '''
     def __init__(self, unique_id: int, initial_opinion:int, model: Model):
         super().__init__(unique_id, model)
         self.opinion = initial_opinion
         self.f = 0
+    
+    @property
+    def opinion(self):
+        return self.model.agent_states[self.unique_id]
+    
+    @opinion.setter
+    def opinion(self, opinion):
+        self.model.agent_states[self.unique_id] = opinion
+    
+    @property
+    def f(self):
+        return self.model.agent_fs[self.unique_id]
+    
+    @f.setter
+    def f(self, f):
+        self.model.agent_fs[self.unique_id] = f
         
     def step(self):
-        self.compute_f()
+        model = self.model
+        i = self.unique_id
+        old_opinion = model.agent_states[i]
+        old_f = model.agent_fs[i]
+        
+        f = self.compute_f()
         
-        if self.f > self.model.f_threshold:
-            self.opinion = 1
+        if f > model.f_threshold:
+            model.agent_states[i] = 1
         else:
-            self.opinion = 0
+            model.agent_states[i] = 0
+        
+        # The totals take the stored value of f, which may be rounded
+        model.agent_fs[i] = f
+        model.update_totals(old_opinion, model.agent_states[i], old_f, model.agent_fs[i])
     
     def compute_f(self):
+        # On the complete graph, neighbors hold all yes opinions but the agent's own
+        if self.model.mean_field:
+            return (self.model.total_yes - self.opinion) / (self.model.n - 1)
+        
         total = 0.0
         neighbors = self.model.get_neighbors(self.unique_id)
         k = len(neighbors)
         
         if k == 0:
-            self.f = 0
+            return 0
         else:
-            # Filter agents by neighbors
-            filtered = filter(lambda a: a.unique_id in neighbors, self.model.schedule.agents)
+            # Read neighbors directly from the id-indexed agent store
+            states = self.model.agent_states
             
-            for ag in filtered:
-                total += ag.opinion
+            for j in neighbors:
+                total += states[j]
                 
             total /= k
-            self.f = total
+            return total
         
 class DyadicABMVoterModel(AbstractVoterModel,Model):
     '''
@@ -60,14 +92,21 @@ class DyadicABMVoterModel(AbstractVoterModel,Model):
         # Create a scheduler
         self.schedule = RandomActivation(self)
         
+        # Opinions and values of f are stored by agent id, and agents are also stored by
+        # id for constant time lookups
+        self.agent_states, self.agent_fs = self.make_stores()
+        self.agent_store = [None] * self.n
+        
         # Add agents based on precomputed proportions of initial opinions
         for i in self.initial_yes:
             yes_agent = DyadicABMVoterAgent(i, 1, self)
             self.schedule.add(yes_agent)
+            self.agent_store[i] = yes_agent
             
         for i in self.initial_no:
             no_agent = DyadicABMVoterAgent(i, 0, self)
             self.schedule.add(no_agent)
+            self.agent_store[i] = no_agent
 
     def step(self):
         if self.stepno == self.max_steps:
@@ -80,11 +119,10 @@ class DyadicABMVoterModel(AbstractVoterModel,Model):
         pass
     
     def get_opinion(self, i):
-        return self.get_agent(i).opinion
+        return self.agent_states[i]
     
     def get_f(self, i):
-        return self.get_agent(i).f
+        return self.agent_fs[i]
     
     def get_agent(self, i):
-        filtered = list(filter(lambda a: a.unique_id == i, self.schedule.agents))
-        return filtered[0]
\ No newline at end of file
+        return self.agent_store[i]
\ No newline at end of file
@@ -3,6 +3,7 @@
 # This program and the accompanying materials are made available under the
 # terms of the Mozilla Public License v2.0 which accompanies this distribution,
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import array
 import random
 
 from networkx import Graph
@@ -14,8 +15,17 @@ class DyadicMatrixVoterModel(AbstractVoterModel):
     '''
     This voter model only has dyadic interactions, uses state vector to represent agents, and
     updates all state agents simultaneously at the end of one simulation step.
+    
+    With frontier, only the agents next to an opinion change of the previous step are
+    recomputed, from per-agent counts of yes neighbors updated as opinions change, so that
+    a step costs in the number of changes instead of n. The values of f are the same, and
+    the sum of f is kept exact instead of summed in update order.
     '''
-    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db, **kwargs):
+    
+    deterministic = True
+    
+    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db,
+                 frontier=False, **kwargs):
         super().__init__(uuid_exp=uuid_exp,
                          ensemble_id=ensemble_id,
                          simtype=SimulationType.MATRIX,
@@ -27,41 +37,105 @@ class DyadicMatrixVoterModel(AbstractVoterModel):
                          max_steps=max_steps,
                          db=db,
                          **kwargs)
-        # We represent the agent store as a dictionary
-        self.agent_states = {}
-        self.agent_fs = {}
+        # We represent the agent store as sequences indexed by agent id, with the initial
+        # opinions and a trivial value of f
+        self.agent_states, self.agent_fs = self.make_stores()
         
-        # Add agents depending on their initial opinion, start with
-        # a trivial value of f
-        for i in self.initial_yes:
-            self.agent_states[i] = 1
-            self.agent_fs[i] = 0
-            
-        for i in self.initial_no:
-            self.agent_states[i] = 0
-            self.agent_fs[i] = 0
+        # On the complete graph every change reaches all agents, so there is no frontier.
+        # Initial opinions do not follow from f, so the first step is always computed in full
+        self.frontier = frontier and not(self.mean_field)
+        self.yes_neighbors = None
+        self.degrees = None
+        self.stale = None
             
     def step(self):
         if self.stepno == self.max_steps:
             self.running = False
+        elif self.stale is not None:
+            self.step_frontier()
         else:
-            # Compute a new map for all agents and replace the old map
-            new_states = {}
+            # Compute a new store for all agents and replace the old store
+            new_states = self.make_store('b')
+            
+            # All agents change, so the count of yes is recomputed along the way
+            total_yes = 0
             
-            # Shuffle the agents list in place
-            random.shuffle(self.agent_list)
+            # Shuffle the agents list in place. Updates are simultaneous, so the compact
+            # state keeps no list and goes in id order
+            if not(self.compact_state):
+                random.shuffle(self.agent_list)
             
             for i in self.agent_list:
-                self.agent_fs[i] = self.compute_f(i)
+                f = self.compute_f(i)
                 
-                if self.agent_fs[i] > self.f_threshold:
+                self.agent_fs[i] = f
+                
+                if f > self.f_threshold:
                     new_states[i] = 1
-                else:
-                    new_states[i] = 0
+                    total_yes += 1
                     
+            if self.frontier:
+                self.start_frontier(new_states)
+            
+            # The exact sum of the stored values, which may be rounded, does not depend on
+            # the update order and matches the frontier steps
             self.agent_states = new_states
+            self.set_totals(total_yes, self.agent_fs)
+    
+    def start_frontier(self, new_states):
+        '''
+        Counts the yes neighbors of every agent after a full step, and marks the neighbors
+        of the agents that changed opinion as the ones to recompute
+        '''
+        self.yes_neighbors = self.make_store('i')
+        self.degrees = array.array('i', self.degree.tolist()) if self.compact_state else self.degree.tolist()
+        self.stale = set()
+        
+        for i in range(0, self.n):
+            neighbors = self.get_neighbors(i)
+            
+            for j in neighbors:
+                self.yes_neighbors[i] += new_states[j]
+            
+            if new_states[i] != self.agent_states[i]:
+                self.stale.update(neighbors)
+    
+    def step_frontier(self):
+        '''
+        Recomputes f for the agents whose yes neighbors changed, all from the counts at the
+        beginning of the step, then applies the opinion changes to the counts of their
+        neighbors, which are the agents to recompute in the next step
+        '''
+        flipped = []
+        
+        for i in self.stale:
+            k = self.degrees[i]
+            old_f = self.agent_fs[i]
+            new_f = self.yes_neighbors[i] / k if k > 0 else 0
+            
+            if new_f != old_f:
+                self.agent_fs[i] = new_f
+                self.update_totals(0, 0, old_f, self.agent_fs[i])
+            
+            if (1 if new_f > self.f_threshold else 0) != self.agent_states[i]:
+                flipped.append(i)
+        
+        self.stale = set()
+        
+        for i in flipped:
+            delta = 1 - 2 * self.agent_states[i]
+            self.agent_states[i] += delta
+            self.total_yes += delta
+            
+            for j in self.get_neighbors(i):
+                self.yes_neighbors[j] += delta
+                self.stale.add(j)
             
     def compute_f(self, i):
+        # On the complete graph, neighbors hold all yes opinions but the agent's own
+        if self.mean_field:
+            return (self.total_yes - self.agent_states[i]) / (self.n - 1)
+        
         total = 0.0
         neighbors = self.get_neighbors(i)
         k = len(neighbors)
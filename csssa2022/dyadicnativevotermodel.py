@@ -0,0 +1,84 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import numpy as np
+
+from networkx import Graph
+from csssa2022 import kernels
+from csssa2022.selections import InteractionType, SimulationType
+from csssa2022.abstractnativevotermodel import AbstractNativeVoterModel
+from csssa2022.scheduler import RandomSequentialScheduler
+
+
+class DyadicNativeVoterModel(AbstractNativeVoterModel):
+    '''
+    This voter model is the counterpart of DyadicABMVoterModel without Mesa. Every step
+    activates all agents in random order, and each one takes the majority of its neighbors
+    immediately, so later agents see the opinions updated earlier in the step. Activation
+    orders are those of Mesa, so both engines give the same results.
+    '''
+    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db, **kwargs):
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=SimulationType.ABM,
+                         interactions=InteractionType.DYADIC,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        # Agents are scheduled in the order the Mesa models add them
+        self.schedule = RandomSequentialScheduler(self.schedule_order(typed=self.kernels), self.random)
+        
+        if self.kernels:
+            self.order_array = np.frombuffer(self.schedule.order, dtype=np.int32)
+    
+    def step(self):
+        if self.stepno == self.max_steps:
+            self.running = False
+        elif self.kernels:
+            # The kernel shuffles the order of the scheduler with the generator of the model
+            state = kernels.MersenneState(self.random)
+            total_yes = kernels.dyadic_step(state.mt, state.pos, self.order_array, *self.kernel_csr,
+                                            self.state_array, self.f_array, self.n, self.f_threshold,
+                                            self.mean_field, self.total_yes)
+            state.store()
+            
+            self.schedule.steps += 1
+            self.set_kernel_totals(total_yes)
+        else:
+            for i in self.schedule.step():
+                old_opinion = self.agent_states[i]
+                old_f = self.agent_fs[i]
+                
+                f = self.compute_f(i)
+                opinion = 1 if f > self.f_threshold else 0
+                
+                # The sum of f is exact, so agents left unchanged can skip the totals, which
+                # take the stored values
+                if f != old_f or opinion != old_opinion:
+                    self.agent_states[i] = opinion
+                    self.agent_fs[i] = f
+                    self.update_totals(old_opinion, opinion, old_f, self.agent_fs[i])
+    
+    def compute_f(self, i):
+        # On the complete graph, neighbors hold all yes opinions but the agent's own
+        if self.mean_field:
+            return (self.total_yes - self.agent_states[i]) / (self.n - 1)
+        
+        total = 0.0
+        neighbors = self.get_neighbors(i)
+        k = len(neighbors)
+        
+        if k == 0:
+            return 0
+        else:
+            for j in neighbors:
+                total += self.agent_states[j]
+            
+            total /= k
+            return total
\ No newline at end of file
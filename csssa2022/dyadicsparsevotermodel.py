@@ -0,0 +1,73 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import numpy as np
+
+from networkx import Graph
+from csssa2022.selections import InteractionType, SimulationType
+from csssa2022.abstractsparsevotermodel import AbstractSparseVoterModel
+from csssa2022.network import NetworkUtil
+
+
+class DyadicSparseVoterModel(AbstractSparseVoterModel):
+    '''
+    This voter model is the vectorized counterpart of DyadicMatrixVoterModel. Opinions are
+    kept in an array and, since all agents are updated simultaneously, every value of f is
+    obtained in one sparse matrix-vector product per step.
+    '''
+    
+    deterministic = True
+    
+    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db, **kwargs):
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=SimulationType.MATRIX,
+                         interactions=InteractionType.DYADIC,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        # Unweighted adjacency, the row normalization is applied through the degrees
+        self.adjacency = None if self.mean_field else NetworkUtil.make_adjacency(network)
+    
+    def step(self):
+        if self.stepno == self.max_steps:
+            self.running = False
+        else:
+            # Update in place, the arrays may be views on an ensemble state matrix.
+            # Opinions follow from f before it is stored, possibly rounded
+            fs = self.compute_fs(self.agent_states)
+            self.agent_fs[:] = fs
+            self.agent_states[:] = fs > self.f_threshold
+            self.recount_totals()
+    
+    def compute_fs(self, states):
+        '''
+        Computes f for all agents at once. Counting yes neighbors with the unweighted
+        adjacency and dividing by the degree gives exactly the same floats as the
+        per-agent sums of DyadicMatrixVoterModel. States may also be an n x E matrix
+        holding one opinion vector per column. On the complete graph, the count of yes
+        neighbors is the count of yes agents minus the agent's own opinion.
+        '''
+        if self.mean_field:
+            return (states.sum(axis=0) - states) / (self.n - 1)
+        
+        total = self.adjacency @ states
+        degree = self.degree if states.ndim == 1 else self.degree[:, None]
+        
+        return np.divide(total, degree, out=np.zeros(total.shape), where=degree > 0)
+    
+    def compute_f(self, i):
+        k = self.degree[i]
+        
+        if self.mean_field:
+            return (self.count_opinion(1) - self.agent_states[i]) / k
+        elif k == 0:
+            return 0
+        else:
+            return self.agent_states[self.indices[self.indptr[i]:self.indptr[i + 1]]].sum() / k
\ No newline at end of file
@@ -14,17 +14,36 @@ from mesa.time import RandomActivation
 
 
 class HigherOrderABMVoterAgent(Agent):
+    '''
+    The opinion and f of an agent are held in the agent store of the model, by agent id
+    '''
     def __init__(self, unique_id: int, initial_opinion:int, model):
         super().__init__(unique_id, model)
         # Agents are not active unless the scheduler activates them during each model step
         self.active = False
         self.opinion = initial_opinion
         self.f = 0
+    
+    @property
+    def opinion(self):
+        return self.model.agent_states[self.unique_id]
+    
+    @opinion.setter
+    def opinion(self, opinion):
+        self.model.agent_states[self.unique_id] = opinion
+    
+    @property
+    def f(self):
+        return self.model.agent_fs[self.unique_id]
+    
+    @f.setter
+    def f(self, f):
+        self.model.agent_fs[self.unique_id] = f
         
     def step(self):
         if self.active:
             # Partition the graph based on current id
-            partition = self.model.get_neighbors(self.unique_id) + [self.unique_id]
+            partition = self.model.make_partition(self.unique_id, self.model.interactants)
                 
             # Compute the value of the partition
             f_part, interactants = self.compute_f(partition, self.model.interactants)
@@ -48,16 +67,24 @@ class HigherOrderABMVoterAgent(Agent):
         else:
             sample = partition
         
+        states = self.model.agent_states
+        
         for j in sample:
-            total += self.model.get_opinion(j)
+            total += states[j]
             
         total /= k
         return total, sample
     
     def propagate(self, interactants, opinion, f):
+        states = self.model.agent_states
+        fs = self.model.agent_fs
+        
+        # The totals take the stored values of f, which may be rounded
         for i in interactants:
-            self.model.get_agent(i).opinion = opinion
-            self.model.get_agent(i).f = f
+            old_opinion, old_f = states[i], fs[i]
+            states[i] = opinion
+            fs[i] = f
+            self.model.update_totals(old_opinion, opinion, old_f, fs[i])
         
 class HigherOrderABMVoterModel(AbstractVoterModel,Model):
     '''
@@ -78,14 +105,21 @@ class HigherOrderABMVoterModel(AbstractVoterModel,Model):
         # Create a scheduler
         self.schedule = RandomActivation(self)
         
+        # Opinions and values of f are stored by agent id, and agents are also stored by
+        # id for constant time lookups
+        self.agent_states, self.agent_fs = self.make_stores()
+        self.agent_store = [None] * self.n
+        
         # Add agents based on precomputed proportions of initial opinions
         for i in self.initial_yes:
             yes_agent = HigherOrderABMVoterAgent(i, 1, self)
             self.schedule.add(yes_agent)
+            self.agent_store[i] = yes_agent
             
         for i in self.initial_no:
             no_agent = HigherOrderABMVoterAgent(i, 0, self)
             self.schedule.add(no_agent)
+            self.agent_store[i] = no_agent
             
     def step(self):
         if self.stepno == self.max_steps:
@@ -95,8 +129,8 @@ class HigherOrderABMVoterModel(AbstractVoterModel,Model):
            centroids = random.sample(self.agent_list, math.ceil(self.n/self.interactants))
            
            # Activate only these agents
-           for a in filter(lambda a: a.unique_id in centroids, self.schedule.agents):
-               a.active = True
+           for c in centroids:
+               self.agent_store[c].active = True
             
            self.schedule.step()
            
@@ -104,12 +138,10 @@ class HigherOrderABMVoterModel(AbstractVoterModel,Model):
         pass
     
     def get_opinion(self, i):
-        return self.get_agent(i).opinion
+        return self.agent_states[i]
     
     def get_f(self, i):
-        filtered = list(filter(lambda a: a.unique_id == i, self.schedule.agents))
-        return filtered[0].f
+        return self.agent_fs[i]
     
     def get_agent(self, i):
-        filtered = list(filter(lambda a: a.unique_id == i, self.schedule.agents))
-        return filtered[0]
\ No newline at end of file
+        return self.agent_store[i]
\ No newline at end of file
@@ -28,19 +28,9 @@ class HigherOrderMatrixVoterModel(AbstractVoterModel):
                          max_steps=max_steps,
                          db=db,
                          **kwargs)
-        # We represent the agent store as a dictionary
-        self.agent_states = {}
-        self.agent_fs = {}
-        
-        # Add agents depending on their initial opinion, start with
-        # a trivial value of f
-        for i in self.initial_yes:
-            self.agent_states[i] = 1
-            self.agent_fs[i] = 0
-            
-        for i in self.initial_no:
-            self.agent_states[i] = 0
-            self.agent_fs[i] = 0
+        # We represent the agent store as sequences indexed by agent id, with the initial
+        # opinions and a trivial value of f
+        self.agent_states, self.agent_fs = self.make_stores()
         
     def step(self):
         if self.stepno == self.max_steps:
@@ -58,7 +48,7 @@ class HigherOrderMatrixVoterModel(AbstractVoterModel):
             
             for c in centroids:
                 # The partition includes itself
-                partition = self.get_neighbors(c) + [c]
+                partition = self.make_partition(c, self.interactants)
                 
                 # Compute the value of the partition
                 f_part, interactants = self.compute_f(partition, self.interactants)
@@ -71,12 +61,13 @@ class HigherOrderMatrixVoterModel(AbstractVoterModel):
                 else:
                     new_states.update(dict.fromkeys(interactants, 0))
 
-            # Update new states and fs manually
+            # Update new states and fs manually, along with the running totals of the
+            # stored values, which may be rounded
             for a, op in new_states.items():
+                old_opinion, old_f = self.agent_states[a], self.agent_fs[a]
                 self.agent_states[a] = op
-                
-            for a, op in new_fs.items():
-                self.agent_fs[a] = op
+                self.agent_fs[a] = new_fs[a]
+                self.update_totals(old_opinion, op, old_f, self.agent_fs[a])
             
     def compute_f(self, partition: list(), interactants: int):
         '''
@@ -0,0 +1,86 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import math
+import random
+
+from networkx import Graph
+from csssa2022 import kernels
+from csssa2022.selections import InteractionType, SimulationType
+from csssa2022.abstractnativevotermodel import AbstractNativeVoterModel
+
+
+class HigherOrderNativeVoterModel(AbstractNativeVoterModel):
+    '''
+    This voter model is the counterpart of HigherOrderABMVoterModel without Mesa. Every step
+    draws the centroids and only visits them, each one updating its group in place. The
+    centroids are drawn in random order, which serves as their activation order instead
+    of shuffling all agents, so results agree with the Mesa engine in distribution only.
+    '''
+    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db, **kwargs):
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=SimulationType.ABM,
+                         interactions=InteractionType.HIGHER_ORDER,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        self.n_centroids = math.ceil(self.n/self.interactants)
+    
+    def step(self):
+        if self.stepno == self.max_steps:
+            self.running = False
+        elif self.kernels:
+            # As the Python step, the kernel draws from the random module
+            state = kernels.MersenneState(random)
+            total_yes = kernels.higher_order_step(state.mt, state.pos, *self.kernel_csr, self.state_array,
+                                                  self.f_array, self.n, self.interactants, self.n_centroids,
+                                                  kernels.sample_setsize(self.n_centroids),
+                                                  kernels.sample_setsize(self.interactants), self.f_threshold,
+                                                  self.mean_field, self.total_yes)
+            state.store()
+            
+            self.set_kernel_totals(total_yes)
+        else:
+            # Obtain a random sample set corresponding to centroids, in activation order
+            centroids = random.sample(self.agent_list, self.n_centroids)
+            
+            for c in centroids:
+                # Partition the graph based on the centroid and compute the value of the partition
+                partition = self.make_partition(c, self.interactants)
+                f_part, interactants = self.compute_f(partition, self.interactants)
+                opinion = 1 if f_part > self.f_threshold else 0
+                
+                # The sum of f is exact, so agents left unchanged can skip the totals, which
+                # take the stored values
+                for i in interactants:
+                    old_opinion, old_f = self.agent_states[i], self.agent_fs[i]
+                    
+                    if f_part != old_f or opinion != old_opinion:
+                        self.agent_states[i] = opinion
+                        self.agent_fs[i] = f_part
+                        self.update_totals(old_opinion, opinion, old_f, self.agent_fs[i])
+    
+    def compute_f(self, partition, interactants):
+        total = 0.0
+        
+        k = len(partition)
+        
+        # Take a subset of interactants when possible
+        if k > interactants:
+            sample = random.sample(partition, interactants)
+            k = interactants
+        else:
+            sample = partition
+        
+        for j in sample:
+            total += self.agent_states[j]
+        
+        total /= k
+        return total, sample
\ No newline at end of file
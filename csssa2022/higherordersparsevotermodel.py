@@ -0,0 +1,110 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import math
+import numpy as np
+
+from networkx import Graph
+from csssa2022.selections import InteractionType, SimulationType
+from csssa2022.abstractsparsevotermodel import AbstractSparseVoterModel
+
+
+class HigherOrderSparseVoterModel(AbstractSparseVoterModel):
+    '''
+    This voter model is the vectorized counterpart of HigherOrderMatrixVoterModel. Centroids
+    and interactants of one step are drawn in bulk from the CSR neighborhoods, and the group
+    updates are scattered into the state arrays at the end of the step.
+    '''
+    def __init__(self, uuid_exp, ensemble_id, interactants, initial_state, network: Graph, n, max_steps, db, **kwargs):
+        super().__init__(uuid_exp=uuid_exp,
+                         ensemble_id=ensemble_id,
+                         simtype=SimulationType.MATRIX,
+                         interactions=InteractionType.HIGHER_ORDER,
+                         interactants=interactants,
+                         initial_state=initial_state,
+                         network=network,
+                         n=n,
+                         max_steps=max_steps,
+                         db=db,
+                         **kwargs)
+        self.n_centroids = math.ceil(self.n/self.interactants)
+    
+    def step(self):
+        if self.stepno == self.max_steps:
+            self.running = False
+        else:
+            # Obtain a random sample set corresponding to centroids, in update order
+            centroids = self.rng.choice(self.n, self.n_centroids, replace=False)
+            
+            # Draw the interactants of every partition and compute their f from the
+            # states at the beginning of the step
+            groups, members = self.sample_interactants(centroids)
+            f_parts = self.compute_f(groups, members)
+            
+            # Later centroids overwrite earlier ones, so keep the last write per agent
+            reversed_members = members[::-1]
+            targets, last = np.unique(reversed_members, return_index=True)
+            winners = groups[::-1][last]
+            
+            old_states = self.agent_states[targets]
+            old_fs = self.agent_fs[targets]
+            
+            self.agent_fs[targets] = f_parts[winners]
+            self.agent_states[targets] = f_parts[winners] > self.f_threshold
+            
+            # Update the running totals over the agents written, with f as stored
+            new_states = self.agent_states[targets]
+            new_fs = self.agent_fs[targets]
+            changed = new_fs != old_fs
+            
+            self.total_yes += int(new_states.sum(dtype=np.int64)) - int(old_states.sum(dtype=np.int64))
+            self.add_fs(new_fs[changed].tolist() + (-old_fs[changed]).tolist())
+    
+    def sample_interactants(self, centroids):
+        '''
+        Each partition holds the neighbors of its centroid and the centroid itself. A uniform
+        subset of size interactants is drawn for all partitions at once with Floyd's algorithm
+        over positions in the partition, so partitions are never enumerated. Returns the
+        partition index and agent id of every interactant, grouped in centroid order.
+        '''
+        n_groups = len(centroids)
+        sizes = self.degree[centroids].astype(np.int64) + 1
+        chosen = np.zeros((n_groups, self.interactants), dtype=np.int64)
+        
+        for j in range(0, self.interactants):
+            top = sizes - self.interactants + j
+            candidates = self.rng.integers(0, np.maximum(top + 1, 1))
+            taken = (chosen[:, :j] == candidates[:, None]).any(axis=1)
+            chosen[:, j] = np.where(taken, top, candidates)
+            
+        # Partitions not larger than interactants take all of their members
+        small = sizes <= self.interactants
+        chosen[small] = np.arange(0, self.interactants)
+        valid = chosen < sizes[:, None]
+        
+        # Position k of a partition is its k-th neighbor, the last position is the centroid
+        groups = np.repeat(np.arange(n_groups), self.interactants).reshape(n_groups, -1)[valid]
+        positions = chosen[valid]
+        owners = centroids[groups]
+        is_neighbor = positions < self.degree[owners]
+        
+        # On the complete graph, the k-th neighbor is the k-th agent other than the centroid
+        if self.mean_field:
+            members = np.where(is_neighbor, positions + (positions >= owners), owners)
+        else:
+            members = np.where(is_neighbor,
+                               self.indices[np.where(is_neighbor, self.indptr[owners] + positions, 0)],
+                               owners)
+        
+        return groups, members
+    
+    def compute_f(self, groups, members):
+        '''
+        The value of f is computed in bloc for every sampled partition
+        '''
+        total = np.bincount(groups, weights=self.agent_states[members], minlength=self.n_centroids)
+        k = np.bincount(groups, minlength=self.n_centroids)
+        
+        return total / k
\ No newline at end of file
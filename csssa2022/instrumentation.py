@@ -0,0 +1,104 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    '''
+    Accumulates the wall-clock time spent in named phases of a run and the number of times
+    each phase was entered. Timing a phase costs two clock reads, so models always carry
+    one, and the model driver writes them out on request.
+    '''
+    
+    def __init__(self):
+        self.phases = {}
+    
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+    
+    def add(self, name, seconds, count=1):
+        totals = self.phases.get(name)
+        
+        if totals is None:
+            self.phases[name] = [seconds, count]
+        else:
+            totals[0] += seconds
+            totals[1] += count
+    
+    def merge(self, other):
+        for name, (seconds, count) in other.phases.items():
+            self.add(name, seconds, count)
+    
+    def seconds(self, name):
+        return self.phases.get(name, [0.0, 0])[0]
+    
+    def to_json(self, uuid_exp, ensemble_id):
+        '''
+        One line of a timings file, with the seconds and count of every phase
+        '''
+        phases = {name: {'seconds': seconds, 'count': count} for name, (seconds, count) in self.phases.items()}
+        
+        return json.dumps({'uuid_exp': uuid_exp, 'ensemble_id': ensemble_id, 'phases': phases})
+    
+    def write(self, path, uuid_exp, ensemble_id):
+        '''
+        Appends the timings of an ensemble point to a JSON lines file
+        '''
+        with open(path, 'a') as f:
+            f.write(self.to_json(uuid_exp, ensemble_id) + '\n')
+    
+    def report(self):
+        lines = [f'{name:>10}: {seconds:10.3f} s {count:10d} calls' for name, (seconds, count) in self.phases.items()]
+        
+        return '\n'.join(lines)
+
+
+def profile_call(path, function, *args, top=25, **kwargs):
+    '''
+    Calls function under cProfile and tracemalloc. The profile is dumped to path, readable
+    with pstats or snakeviz, and the largest allocation sites to path.memory.txt. Only the
+    calling process is profiled, so worker processes are not covered, and tracemalloc slows
+    down allocation-heavy code considerably.
+    '''
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    
+    try:
+        return function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics('lineno')
+        tracemalloc.stop()
+        
+        profiler.dump_stats(path)
+        
+        with open(f'{path}.memory.txt', 'w') as f:
+            f.write(f'Peak traced memory: {peak / 1024**2:.1f} MB\n')
+            
+            for stat in allocations[:top]:
+                f.write(f'{stat}\n')
+        
+        # Report the most expensive calls
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        
+        print(out.getvalue())
+        print(f'Peak traced memory: {peak / 1024**2:.1f} MB - profile written to {path}')
\ No newline at end of file
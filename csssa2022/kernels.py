@@ -0,0 +1,235 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import math
+import numpy as np
+
+# The compiled kernels are optional, without Numba the same functions run as Python
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Whether the kernels are compiled, in which case the model driver selects them
+compiled = njit is not None
+
+
+def jit(function):
+    '''
+    Compiles function with Numba when it is installed, and leaves it as it is otherwise
+    '''
+    if njit is None:
+        return function
+    
+    return njit(cache=True, nogil=True)(function)
+
+
+class MersenneState:
+    '''
+    The state of a Python generator, random.Random or the random module itself, as the
+    arrays the kernels draw from. The kernels draw words and bounded integers exactly as
+    CPython does, so that shuffles and samples are those of the Python models, and the
+    state is written back to the generator after a step.
+    '''
+    __slots__ = ('rng', 'version', 'mt', 'pos', 'gauss_next')
+    
+    def __init__(self, rng):
+        self.rng = rng
+        self.version, internal, self.gauss_next = rng.getstate()
+        self.mt = np.array(internal[:-1], dtype=np.uint32)
+        self.pos = np.array(internal[-1:], dtype=np.int64)
+    
+    def store(self):
+        self.rng.setstate((self.version, tuple(self.mt.tolist()) + (int(self.pos[0]),), self.gauss_next))
+
+
+def sample_setsize(k):
+    '''
+    Population size up to which random.sample draws k items from a copy of the population
+    instead of rejecting repeated draws
+    '''
+    setsize = 21
+    
+    if k > 5:
+        setsize += 4 ** math.ceil(math.log(k * 3, 4))
+    
+    return setsize
+
+
+@jit
+def genrand(mt, pos):
+    '''
+    Next 32 bit word of the Mersenne Twister, as genrand_uint32 in CPython
+    '''
+    if pos[0] >= 624:
+        for kk in range(0, 624):
+            y = (np.int64(mt[kk]) & 0x80000000) | (np.int64(mt[(kk + 1) % 624]) & 0x7fffffff)
+            mt[kk] = np.int64(mt[(kk + 397) % 624]) ^ (y >> 1) ^ (0x9908b0df if y & 1 else 0)
+        
+        pos[0] = 0
+    
+    y = np.int64(mt[pos[0]])
+    pos[0] += 1
+    
+    y ^= y >> 11
+    y ^= (y << 7) & 0x9d2c5680
+    y ^= (y << 15) & 0xefc60000
+    y ^= y >> 18
+    
+    return y
+
+
+@jit
+def randbelow(mt, pos, n):
+    '''
+    Uniform integer in [0, n) for 0 < n < 2**32, as Random._randbelow in CPython
+    '''
+    k = 0
+    m = n
+    
+    while m > 0:
+        k += 1
+        m >>= 1
+    
+    r = genrand(mt, pos) >> (32 - k)
+    
+    while r >= n:
+        r = genrand(mt, pos) >> (32 - k)
+    
+    return r
+
+
+@jit
+def shuffle(mt, pos, x):
+    '''
+    Shuffles x in place, as random.shuffle
+    '''
+    for i in range(len(x) - 1, 0, -1):
+        j = randbelow(mt, pos, i + 1)
+        x[i], x[j] = x[j], x[i]
+
+
+@jit
+def sample_positions(mt, pos, m, k, setsize):
+    '''
+    Positions in a population of size m of the k items random.sample draws, in order.
+    Small populations are sampled from a pool of positions and large ones by rejecting
+    repeated positions, with the setsize of random.sample for k.
+    '''
+    out = np.empty(k, dtype=np.int64)
+    
+    if m <= setsize:
+        pool = np.arange(0, m)
+        
+        for i in range(0, k):
+            j = randbelow(mt, pos, m - i)
+            out[i] = pool[j]
+            pool[j] = pool[m - i - 1]
+    elif k <= 32:
+        # Few draws are checked against the previous ones
+        for i in range(0, k):
+            j = randbelow(mt, pos, m)
+            
+            while (out[:i] == j).any():
+                j = randbelow(mt, pos, m)
+            
+            out[i] = j
+    else:
+        selected = np.zeros(m, dtype=np.bool_)
+        
+        for i in range(0, k):
+            j = randbelow(mt, pos, m)
+            
+            while selected[j]:
+                j = randbelow(mt, pos, m)
+            
+            selected[j] = True
+            out[i] = j
+    
+    return out
+
+
+@jit
+def dyadic_step(mt, pos, order, indptr, indices, states, fs, n, threshold, mean_field, total_yes):
+    '''
+    One step of DyadicNativeVoterModel. The activation order is shuffled in place, then
+    every agent takes the majority of its neighbors immediately. Neighbors of agent i are
+    indices[indptr[i]:indptr[i+1]], unused on the complete graph. Returns the new count
+    of yes opinions.
+    '''
+    shuffle(mt, pos, order)
+    
+    for i in order:
+        # On the complete graph, neighbors hold all yes opinions but the agent's own
+        if mean_field:
+            f = (total_yes - np.int64(states[i])) / (n - 1)
+        else:
+            k = indptr[i + 1] - indptr[i]
+            total = 0.0
+            
+            for p in range(indptr[i], indptr[i + 1]):
+                total += states[indices[p]]
+            
+            f = total / k if k > 0 else 0.0
+        
+        opinion = 1 if f > threshold else 0
+        total_yes += opinion - np.int64(states[i])
+        states[i] = opinion
+        fs[i] = f
+    
+    return total_yes
+
+
+@jit
+def higher_order_step(mt, pos, indptr, indices, states, fs, n, interactants, n_centroids, centroid_setsize,
+                      group_setsize, threshold, mean_field, total_yes):
+    '''
+    One step of HigherOrderNativeVoterModel. Centroids are drawn, then each one draws
+    its interactants from its partition, its neighbors followed by itself, and sets them
+    to their fraction of yes opinions. On the complete graph, interactants are drawn
+    directly as in AbstractVoterModel.make_partition. Returns the new count of yes
+    opinions.
+    '''
+    centroids = sample_positions(mt, pos, n, n_centroids, centroid_setsize)
+    
+    for c in centroids:
+        if mean_field and n > interactants:
+            # Position j is the j-th agent other than c, the last position is c itself
+            members = sample_positions(mt, pos, n, interactants, group_setsize)
+            
+            for i in range(0, interactants):
+                j = members[i]
+                members[i] = j + (j >= c) if j < n - 1 else c
+        else:
+            if mean_field:
+                partition = np.empty(n, dtype=np.int64)
+                partition[:c] = np.arange(0, c)
+                partition[c:n - 1] = np.arange(c + 1, n)
+            else:
+                partition = np.empty(indptr[c + 1] - indptr[c] + 1, dtype=np.int64)
+                partition[:-1] = indices[indptr[c]:indptr[c + 1]]
+            
+            partition[-1] = c
+            
+            # Take a subset of interactants when possible
+            if len(partition) > interactants:
+                members = partition[sample_positions(mt, pos, len(partition), interactants, group_setsize)]
+            else:
+                members = partition
+        
+        total = 0.0
+        
+        for i in members:
+            total += states[i]
+        
+        f = total / len(members)
+        opinion = 1 if f > threshold else 0
+        
+        for i in members:
+            total_yes += opinion - np.int64(states[i])
+            states[i] = opinion
+            fs[i] = f
+    
+    return total_yes
\ No newline at end of file
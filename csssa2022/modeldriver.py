@@ -4,77 +4,342 @@
 # terms of the Mozilla Public License v2.0 which accompanies this distribution,
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
 import uuid
+import random
+import multiprocessing
+import numpy as np
 
-from csssa2022.database import Database
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from csssa2022.database import Database, RowCollector
+from csssa2022.parquetstorage import ParquetStorage
 from csssa2022.simulation import Simulation
-from csssa2022.network import NetworkEnsembleFactory
-from csssa2022.selections import InteractionType, NetworkType, SimulationType
+from csssa2022.network import NetworkEnsembleFactory, NetworkCache
+from csssa2022.storage import StorageBackend
+from csssa2022.instrumentation import PhaseTimer
+from csssa2022.selections import InteractionType, NetworkType, SimulationType, EngineType, BackendType, ConvergenceType
 from csssa2022.dyadicmatrixvotermodel import DyadicMatrixVoterModel
-from csssa2022.dyadicabmvotermodel import DyadicABMVoterModel
+from csssa2022.dyadicsparsevotermodel import DyadicSparseVoterModel
 from csssa2022.higherordermatrixvotermodel import HigherOrderMatrixVoterModel
-from csssa2022.higherorderabmvotermodel import HigherOrderABMVoterModel
+from csssa2022.higherordersparsevotermodel import HigherOrderSparseVoterModel
+from csssa2022.dyadicnativevotermodel import DyadicNativeVoterModel
+from csssa2022.higherordernativevotermodel import HigherOrderNativeVoterModel
+from csssa2022.sparseensemble import DyadicSparseEnsemble
+from csssa2022 import kernels
 
 class ModelDriver:
     '''
     This class takes care of executing a model within an ensemble.
     '''
     
+    @staticmethod
+    def make_model(simulation: SimulationType, interaction: InteractionType, engine: EngineType,
+                   uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs):
+        '''
+        Instantiate the right type of model, keyword arguments are passed to the model
+        '''
+        model = None
+        
+        if simulation == SimulationType.MATRIX:
+            if interaction == InteractionType.DYADIC:
+                if engine == EngineType.SPARSE:
+                    model = DyadicSparseVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+                else:
+                    model = DyadicMatrixVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+            else:
+                if engine == EngineType.SPARSE:
+                    model = HigherOrderSparseVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+                else:
+                    model = HigherOrderMatrixVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+        elif engine == EngineType.NATIVE:
+            # Compiled kernels give the same results as the Python steps, so they are used
+            # whenever Numba is installed
+            kwargs.setdefault('kernels', kernels.compiled)
+            
+            if interaction == InteractionType.DYADIC:
+                model = DyadicNativeVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+            else:
+                model = HigherOrderNativeVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+        else:
+            # Mesa is only imported when its models are used
+            if interaction == InteractionType.DYADIC:
+                from csssa2022.dyadicabmvotermodel import DyadicABMVoterModel
+                model = DyadicABMVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+            else:
+                from csssa2022.higherorderabmvotermodel import HigherOrderABMVoterModel
+                model = HigherOrderABMVoterModel(uuid_exp, ensemble_id, interactants, initial_state, net, n, max_steps, db, **kwargs)
+                
+        return model
+    
+    @staticmethod
+    def make_storage(backend: BackendType, filename, durable=False):
+        '''
+        Instantiate the storage backend writing to filename, a directory for Parquet
+        '''
+        if backend == BackendType.PARQUET:
+            return ParquetStorage(filename, durable=durable)
+        else:
+            return Database(filename, durable=durable)
+    
+    @staticmethod
+    def make_seeds(seed, ensemble_size):
+        '''
+        Derives independent network and model seeds for every ensemble point from the
+        seed of the experiment, so that members can be computed in any order or process
+        '''
+        children = np.random.SeedSequence(seed).spawn(ensemble_size)
+        
+        return [tuple(int(s) for s in child.generate_state(2)) for child in children]
+    
+    @staticmethod
+    def pool_context():
+        '''
+        Importing Mesa forces the spawn start method, which re-imports everything in each
+        worker. Forking is used instead wherever it is available.
+        '''
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('fork')
+        else:
+            return multiprocessing.get_context()
+    
+    @staticmethod
+    def run_member(ensemble_id, seeds, simulation: SimulationType, interaction: InteractionType,
+                   engine: EngineType, network: NetworkType, uuid_exp, interactants, initial_state,
+                   n, max_steps, compact, implicit=False, cache: NetworkCache = None, snapshots=None,
+                   storage: StorageBackend = None, frontier=False,
+                   convergence: ConvergenceType = ConvergenceType.QUEUE, compact_state=False):
+        '''
+        Computes one ensemble point in a worker process. The rows are returned to the parent
+        process, which remains the only database writer, unless a storage backend allowing
+        concurrent writers is given, in which case the worker stores them itself and returns
+        None instead. The timings of the ensemble point are returned along with the rows.
+        '''
+        network_seed, model_seed = seeds
+        timer = PhaseTimer()
+        
+        with timer.phase('network'):
+            net = NetworkEnsembleFactory(implicit=implicit, cache=cache).make_member(n, network, seed=network_seed)
+        
+        random.seed(model_seed)
+        rows = RowCollector() if storage is None else storage
+        model = ModelDriver.make_model(simulation, interaction, engine, uuid_exp, ensemble_id,
+                                       interactants, initial_state, net, n, max_steps, rows,
+                                       stop_on_convergence=compact, snapshot_interval=snapshots,
+                                       frontier=frontier, convergence=convergence,
+                                       compact_state=compact_state, timer=timer)
+        
+        # Save the initial values and run the model
+        model.save_all()
+        model.run()
+        
+        if storage is not None:
+            with timer.phase('commit'):
+                storage.insert_member(uuid_exp, ensemble_id)
+                storage.checkpoint()
+            
+            return None, timer
+        
+        return rows, timer
+    
+    @staticmethod
+    def make_uuid(simulation: SimulationType, interaction: InteractionType, network: NetworkType,
+                  interactants, n, max_steps, ensemble_size, initial_state, engine: EngineType,
+                  compact, implicit, seed, frontier=False,
+                  convergence: ConvergenceType = ConvergenceType.QUEUE, compact_state=False):
+        '''
+        Derives the uuid of an experiment from everything that determines its results, so
+        that running the same experiment again finds the ensemble points already computed.
+        Options added later only enter the uuid when set, keeping the uuids of existing
+        experiments.
+        '''
+        parameters = [simulation.value, interaction.value, network.value, interactants, n, max_steps,
+                      ensemble_size, initial_state, engine.value, compact, implicit, seed]
+        
+        if frontier:
+            parameters.append('frontier')
+        
+        if convergence != ConvergenceType.QUEUE:
+            parameters.append(convergence.value)
+        
+        if compact_state:
+            parameters.append('compact-state')
+        
+        description = '|'.join(str(p) for p in parameters)
+        
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, description))
+    
     @staticmethod
     def run_model(simulation: SimulationType, interaction: InteractionType, network: NetworkType,
-                  interactants, n, max_steps, ensemble_size, initial_state, filename):
-        # Generate a unique uuid1 per experiment
-        uuid_exp = str(uuid.uuid1())
+                  interactants, n, max_steps, ensemble_size, initial_state, filename,
+                  engine: EngineType = EngineType.PYTHON, batch=False, compact=False, durable=False,
+                  workers=1, seed=None, implicit=False, cache: NetworkCache = None, resume=False,
+                  snapshots=None, backend: BackendType = BackendType.SQLITE, timings=None, frontier=False,
+                  convergence: ConvergenceType = ConvergenceType.QUEUE, compact_state=False):
+        '''
+        Computes an ensemble and stores it. With resume, the experiment is identified by its
+        parameters and seed, and only the ensemble points missing from the database are
+        computed. With snapshots, the states of all agents are stored every snapshots steps.
+        Outputs go to the given storage backend, SQLite by default. With timings, the time
+        spent in each phase of every ensemble point is appended to that JSON lines file.
+        With frontier, synchronous dyadic models only recompute agents next to opinion
+        changes. The convergence test of the models is given by convergence. With
+        compact_state, models keep opinions in one byte, f in single precision and agent
+        ids in int32 arrays, drawing initial opinions from a single permutation.
+        '''
+        if resume and seed is None:
+            raise ValueError('Resuming an experiment requires its seed')
+        
+        if snapshots is not None and snapshots < 1:
+            raise ValueError(f'Snapshots are stored every positive number of steps, got {snapshots}')
+        
+        # Every ensemble point is seeded from the experiment seed, drawn if not given
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        
+        seeds = ModelDriver.make_seeds(seed, ensemble_size)
+        
+        # Generate a unique uuid1 per experiment, or the uuid of its parameters on resume
+        if resume:
+            uuid_exp = ModelDriver.make_uuid(simulation, interaction, network, interactants, n,
+                                             max_steps, ensemble_size, initial_state, engine,
+                                             compact, implicit, seed, frontier=frontier,
+                                             convergence=convergence, compact_state=compact_state)
+        else:
+            uuid_exp = str(uuid.uuid1())
         
         # Report
-        print(f'Running: {uuid_exp} - {simulation.value}, {interaction.value}, {network.value} - S: {n} <M>: {initial_state}')
+        print(f'Running: {uuid_exp} - {simulation.value}, {interaction.value}, {network.value} - S: {n} <M>: {initial_state} Seed: {seed}')
                 
         # Create a new database or open an existing one at the corresponding filename
-        db = Database(filename)
+        db = ModelDriver.make_storage(backend, filename, durable=durable)
         db.connect()
         
-        # Save the current simulation
-        sim = Simulation(uuid_exp, ensemble_size, n, simulation, interaction,
-                         interactants, initial_state, network, max_steps)
-        db.insert_simulation(sim)
+        pending = list(range(0, ensemble_size))
         
-        # Save the initial value
-                
-        # Generate an ensemble of networks
-        nef = NetworkEnsembleFactory()
-        network_ensemble = nef.make_ensemble(n, ensemble_size, network)
-        
-        # Interate over the ensemble to compute and store each model
-        for i, net in network_ensemble.items():
-            # Report start of ensemble point
-            print(f'Computing ensemble point {i}')
+        if resume and db.has_simulation(uuid_exp):
+            # Keep the complete ensemble points only
+            completed = db.read_members(uuid_exp)
+            db.discard_incomplete(uuid_exp)
+            pending = [i for i in pending if i not in completed]
             
-            # Instantiate the right type of model
-            model = None
+            print(f'Resuming: {len(completed)} ensemble points already computed')
+        else:
+            # Save the current simulation
+            sim = Simulation(uuid_exp, ensemble_size, n, simulation, interaction,
+                             interactants, initial_state, network, max_steps)
+            db.insert_simulation(sim)
+        
+        nef = NetworkEnsembleFactory(implicit=implicit, cache=cache)
+        timers = {}
+        
+        # Ensemble points of the sparse dyadic engine on a network that does not vary can
+        # be advanced together as one state matrix
+        batch = batch and engine == EngineType.SPARSE and interaction == InteractionType.DYADIC \
+            and not(nef.variates[network]) and len(pending) > 0
+        
+        if batch:
+            print(f'Computing ensemble points {pending[0]}-{pending[-1]} as a batch')
             
-            if simulation == SimulationType.MATRIX:
-                if interaction == InteractionType.DYADIC:
-                    model = DyadicMatrixVoterModel(uuid_exp, i, interactants, initial_state, net, n, max_steps, db)
-                else:
-                    model = HigherOrderMatrixVoterModel(uuid_exp, i, interactants, initial_state, net, n, max_steps, db)
-            else:
-                if interaction == InteractionType.DYADIC:
-                    model = DyadicABMVoterModel(uuid_exp, i, interactants, initial_state, net, n, max_steps, db)
-                else:
-                    model = HigherOrderABMVoterModel(uuid_exp, i, interactants, initial_state, net, n, max_steps, db)
-                    pass
+            # All ensemble points share a single network, timed with the first one
+            timers = {i: PhaseTimer() for i in pending}
+            
+            with timers[pending[0]].phase('network'):
+                net = nef.make_member(n, network)
+            
+            models = []
+            
+            for i in pending:
+                random.seed(seeds[i][1])
+                model = ModelDriver.make_model(simulation, interaction, engine, uuid_exp, i,
+                                               interactants, initial_state, net, n, max_steps, db,
+                                               stop_on_convergence=compact, snapshot_interval=snapshots,
+                                               frontier=frontier, convergence=convergence,
+                                               compact_state=compact_state, timer=timers[i])
                 
-            # Save the initial values
-            model.save_all()
+                # Save the initial values
+                model.save_all()
+                models.append(model)
                 
-            # Run the model
-            model.run()
+            # Run all models
+            DyadicSparseEnsemble(models).run()
             
-            # Commit the outcomes of the current ensemble
-            db.checkpoint()
+            # Commit the outcomes of the whole ensemble, timed with the first ensemble point
+            with timers[pending[0]].phase('commit'):
+                for i in pending:
+                    db.insert_member(uuid_exp, i)
+                
+                db.checkpoint()
+        elif workers > 1:
+            # Networks are generated and models run in the workers, rows come back in order
+            run_member = partial(ModelDriver.run_member, simulation=simulation, interaction=interaction,
+                                 engine=engine, network=network, uuid_exp=uuid_exp,
+                                 interactants=interactants, initial_state=initial_state, n=n,
+                                 max_steps=max_steps, compact=compact, implicit=implicit,
+                                 cache=cache, snapshots=snapshots, storage=db if db.concurrent else None,
+                                 frontier=frontier, convergence=convergence, compact_state=compact_state)
+            
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ModelDriver.pool_context()) as pool:
+                for i, (rows, timer) in zip(pending, pool.map(run_member, pending, [seeds[i] for i in pending])):
+                    print(f'Computed ensemble point {i}')
+                    
+                    # Rows are only returned by workers that could not store them, and
+                    # their inserts are timed here
+                    with timer.phase('commit'):
+                        if rows is not None:
+                            rows.write(db)
+                            db.insert_member(uuid_exp, i)
+                        
+                        # Commit the outcomes of the current ensemble
+                        db.checkpoint()
+                    
+                    timers[i] = timer
+        else:
+            # Interate over the ensemble to compute and store each model, generating
+            # networks as they are needed
+            for i in pending:
+                # Report start of ensemble point
+                print(f'Computing ensemble point {i}')
+                
+                timer = timers[i] = PhaseTimer()
+                
+                with timer.phase('network'):
+                    net = nef.make_member(n, network, seed=seeds[i][0])
+                
+                random.seed(seeds[i][1])
+                model = ModelDriver.make_model(simulation, interaction, engine, uuid_exp, i,
+                                               interactants, initial_state, net, n, max_steps, db,
+                                               stop_on_convergence=compact, snapshot_interval=snapshots,
+                                               frontier=frontier, convergence=convergence,
+                                               compact_state=compact_state, timer=timer)
+                    
+                # Save the initial values
+                model.save_all()
+                    
+                # Run the model
+                model.run()
+                
+                # Commit the outcomes of the current ensemble
+                with timer.phase('commit'):
+                    db.insert_member(uuid_exp, i)
+                    db.checkpoint()
+                
+                # Release the network before the next one is generated
+                del model, net
+        
+        # Aggregate the ensemble for the analysis and close the database
+        total = PhaseTimer()
+        
+        with total.phase('materialize'):
+            db.materialize(uuid_exp)
         
-        # Close the database
         db.close()
         
+        # Report where the time went
+        if timings is not None:
+            for i, timer in sorted(timers.items()):
+                timer.write(timings, uuid_exp, i)
+                total.merge(timer)
+            
+            print(total.report())
+        
         # Report finalization
-        print('Ensemble computed')
-        
\ No newline at end of file
+        print('Ensemble computed')
\ No newline at end of file
@@ -4,18 +4,280 @@
 # terms of the Mozilla Public License v2.0 which accompanies this distribution,
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
 import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+import hashlib
+import shutil
 import math
+import os
 
+from abc import ABC, abstractmethod
 from csssa2022.selections import NetworkType
 
 
+class ImplicitTopology(ABC):
+    '''
+    Base class of the topologies whose neighbors are computed arithmetically from integer
+    agent ids instead of being stored as a graph. They provide the parts of the networkx
+    interface the models rely on, including the graph attributes used as caches.
+    '''
+    
+    def __init__(self, n):
+        self.n = n
+        self.graph = {}
+    
+    @property
+    def nodes(self):
+        return range(0, self.n)
+    
+    def number_of_nodes(self):
+        return self.n
+    
+    def number_of_edges(self):
+        return int(self.degrees().sum()) // 2
+    
+    def neighbors(self, i):
+        return iter(self.neighbor_ids(np.array([i]))[0].tolist())
+    
+    def degrees(self):
+        return np.full(self.n, self.neighbor_ids(np.array([0])).shape[1], dtype=np.int32)
+    
+    @abstractmethod
+    def neighbor_ids(self, ids):
+        '''
+        Returns a len(ids) x k array with the neighbors of the given agent ids
+        '''
+        pass
+    
+    def csr(self):
+        ids = np.arange(0, self.n)
+        indices = self.neighbor_ids(ids).astype(np.int32).ravel()
+        degree = self.degrees()
+        indptr = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        
+        return indptr, indices, degree
+
+class LatticeTopology(ImplicitTopology):
+    '''
+    Periodic 2D lattices on an L x L grid of agents, with id = row * L + column. The
+    triangular lattice adds one diagonal to the rectangular one, and the hexagonal
+    (honeycomb) lattice is the brick wall that keeps one vertical bond per agent, which
+    requires an even L.
+    '''
+    
+    def __init__(self, n, nt: NetworkType):
+        super().__init__(n)
+        self.nt = nt
+        self.side = math.isqrt(n)
+        
+        if self.side * self.side != n:
+            raise ValueError(f'A lattice needs a square number of agents, got {n}')
+        
+        # Smaller sides would make the same agent a neighbor twice
+        if self.side < 3:
+            raise ValueError(f'A lattice side of {self.side} is too small for {nt.value}')
+        
+        if nt == NetworkType.LATTICE_2D_HEXAGON and self.side % 2:
+            raise ValueError(f'A hexagonal lattice needs an even side, got {self.side}')
+    
+    def neighbor_ids(self, ids):
+        side = self.side
+        row, column = np.divmod(ids, side)
+        
+        if self.nt == NetworkType.LATTICE_2D_RECTANGLE:
+            offsets = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+        elif self.nt == NetworkType.LATTICE_2D_TRIANGLE:
+            offsets = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, 1)]
+        else:
+            # Even sites bond downwards and odd sites upwards
+            vertical = np.where((row + column) % 2 == 0, 1, -1)
+            
+            return np.stack([row * side + (column - 1) % side,
+                             row * side + (column + 1) % side,
+                             ((row + vertical) % side) * side + column], axis=1)
+        
+        return np.stack([((row + dr) % side) * side + (column + dc) % side for dr, dc in offsets], axis=1)
+
+class HyperCubeTopology(ImplicitTopology):
+    '''
+    The hypercube over n = 2^d agents, where neighbors differ in exactly one bit of their ids
+    '''
+    
+    def __init__(self, n):
+        super().__init__(n)
+        self.dimension = int(math.log2(n))
+        
+        if 2**self.dimension != n:
+            raise ValueError(f'A hypercube needs a power of two agents, got {n}')
+    
+    def neighbor_ids(self, ids):
+        return np.stack([ids ^ (1 << b) for b in range(0, self.dimension)], axis=1)
+
+class CompleteTopology(ImplicitTopology):
+    '''
+    The complete graph, where everyone else is a neighbor. Its CSR arrays hold n(n-1)
+    entries, so they should only be requested for small populations.
+    '''
+    
+    def degrees(self):
+        return np.full(self.n, self.n - 1, dtype=np.int32)
+    
+    def neighbor_ids(self, ids):
+        others = np.broadcast_to(np.arange(0, self.n - 1), (len(ids), self.n - 1))
+        
+        # Skip the agent itself by shifting the ids from it onwards
+        return others + (others >= np.asarray(ids)[:, None])
+
+class CSRTopology(ImplicitTopology):
+    '''
+    A topology given by its CSR arrays over agent ids, as produced by NetworkUtil.make_csr.
+    The arrays may be memory maps, so loading a stored network reads only what is used.
+    '''
+    
+    def __init__(self, indptr, indices, degree):
+        super().__init__(len(degree))
+        self.graph['csr'] = (indptr, indices, degree)
+        
+    def number_of_edges(self):
+        return len(self.graph['csr'][1]) // 2
+    
+    def neighbors(self, i):
+        indptr, indices, _ = self.graph['csr']
+        
+        return iter(indices[indptr[i]:indptr[i + 1]].tolist())
+    
+    def degrees(self):
+        return self.graph['csr'][2]
+    
+    def neighbor_ids(self, ids):
+        '''
+        Returns the neighbors of the given agent ids, which must all have the same degree
+        '''
+        indptr, indices, degree = self.graph['csr']
+        k = degree[ids]
+        
+        if len(ids) > 0 and (k != k[0]).any():
+            raise ValueError('Agents of different degrees have no common neighbor array')
+        
+        return indices[indptr[ids][:, None] + np.arange(0, k[0] if len(ids) > 0 else 0)]
+    
+    def csr(self):
+        return self.graph['csr']
+    
+class NetworkCache:
+    '''
+    Persistent cache of generated networks. Each network is stored as the .npy files of its
+    CSR arrays in a directory named after a hash of its type, size, parameters and seed, and
+    loaded back as memory maps. Once the cache exceeds max_bytes, the least recently used
+    networks are removed.
+    '''
+    
+    arrays = ['indptr', 'indices', 'degree']
+    
+    def __init__(self, directory, max_bytes=4 * 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        
+        os.makedirs(self.directory, exist_ok=True)
+        
+    @staticmethod
+    def make_key(nt: NetworkType, n, params, seed=None):
+        description = f'{nt.value}|{n}|{list(params)}|{seed}'
+        
+        return hashlib.sha1(description.encode()).hexdigest()
+    
+    def load(self, key):
+        '''
+        Returns the stored network as a CSRTopology, or None if it is not in the cache or its
+        files cannot be read, e.g., when truncated
+        '''
+        path = os.path.join(self.directory, key)
+        
+        try:
+            network = CSRTopology(*[np.load(os.path.join(path, f'{a}.npy'), mmap_mode='r') for a in NetworkCache.arrays])
+        except (OSError, ValueError):
+            return None
+        
+        # The modification time of an entry records its last use
+        os.utime(path)
+        
+        return network
+    
+    def store(self, key, network):
+        '''
+        Stores the CSR arrays of a network. Entries are written to a temporary directory and
+        renamed, so concurrent runs never read a partial entry. An existing entry that cannot
+        be loaded is replaced.
+        '''
+        path = os.path.join(self.directory, key)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        
+        os.makedirs(temporary, exist_ok=True)
+        
+        for a, values in zip(NetworkCache.arrays, NetworkUtil.make_csr(network)):
+            np.save(os.path.join(temporary, f'{a}.npy'), values)
+            
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            # Either another run stored the same network first, or the entry is damaged and
+            # is moved aside to be replaced
+            if self.load(key) is None:
+                stale = f'{path}.{os.getpid()}.stale.tmp'
+                
+                try:
+                    os.rename(path, stale)
+                    os.rename(temporary, path)
+                except OSError:
+                    pass
+                
+                shutil.rmtree(stale, ignore_errors=True)
+            
+            shutil.rmtree(temporary, ignore_errors=True)
+            
+        self.evict(keep=key)
+        
+    def evict(self, keep=None):
+        entries = []
+        
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            
+            if key.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            
+            size = sum(e.stat().st_size for e in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, key, path))
+            
+        total = sum(e[1] for e in entries)
+        
+        for _, size, key, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            
+            if key != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+    
 class NetworkEnsembleFactory:
     
-    def __init__(self):
+    # Network types built as implicit topologies instead of graphs when implicit is set
+    implicit_types = [NetworkType.LATTICE_2D_RECTANGLE, NetworkType.LATTICE_2D_TRIANGLE, NetworkType.LATTICE_2D_HEXAGON,
+                      NetworkType.HYPER_CUBE, NetworkType.COMPLETE]
+    
+    # The last network that does not vary, shared by all ensembles of this process
+    __shared = {}
+    
+    def __init__(self, implicit=False, cache: NetworkCache = None):
         '''
         For each network type, we provide default values that can be modified. Not elegant for now
-        but may be useful with more complex code.
+        but may be useful with more complex code. With implicit, the structured network types
+        are built as implicit topologies instead of networkx graphs. With a cache, generated
+        networks are stored on disk and loaded by later runs instead of being generated.
         '''
+        self.implicit = implicit
+        self.cache = cache
         
         # Parameters
         self.params = {
@@ -44,20 +306,60 @@ class NetworkEnsembleFactory:
             NetworkType.BARABASI_ALBERT: True
         }
         
-    def make_ensemble(self, n, ensemble_size, nt: NetworkType):
-        ensemble = {}
+    def make_member(self, n, nt: NetworkType, seed=None):
+        '''
+        Makes the network of one ensemble point. Networks that do not vary are built once
+        and shared by all ensemble points, keeping only the latest one.
+        '''
+        if self.variates[nt]:
+            return self.make_cached_network(n, nt, seed=seed)
+        
+        key = (nt, n, self.implicit)
         
-        for i in range(0, ensemble_size):
-            ensemble[i] = self.make_network(n, nt)
+        if key not in NetworkEnsembleFactory.__shared:
+            NetworkEnsembleFactory.__shared.clear()
+            NetworkEnsembleFactory.__shared[key] = self.make_cached_network(n, nt)
             
-        return ensemble
+        return NetworkEnsembleFactory.__shared[key]
     
-    def make_network(self, n, nt: NetworkType):
+    def make_cached_network(self, n, nt: NetworkType, seed=None):
         '''
-        We assume n = 2^k, k % 2 = 0
+        Loads the network from the cache or generates and stores it. Random networks without
+        a seed cannot be reproduced, and implicit topologies cost nothing to build, so
+        neither is cached.
+        '''
+        if self.implicit and nt in NetworkEnsembleFactory.implicit_types:
+            return self.make_network(n, nt, seed=seed)
+        
+        network = None
+        key = None
+        
+        if self.cache is not None and not (self.variates[nt] and seed is None):
+            key = NetworkCache.make_key(nt, n, self.params[nt], seed)
+            network = self.cache.load(key)
+            
+        if network is None:
+            network = self.make_network(n, nt, seed=seed)
+            
+            if key is not None:
+                self.cache.store(key, network)
+                
+        return network
+    
+    def make_network(self, n, nt: NetworkType, seed=None):
+        '''
+        We assume n = 2^k, k % 2 = 0. The seed only applies to random network types.
         '''
         k_half = math.isqrt(n)
         
+        if self.implicit:
+            if nt in [NetworkType.LATTICE_2D_RECTANGLE, NetworkType.LATTICE_2D_TRIANGLE, NetworkType.LATTICE_2D_HEXAGON]:
+                return LatticeTopology(n, nt)
+            elif nt == NetworkType.HYPER_CUBE:
+                return HyperCubeTopology(n)
+            elif nt == NetworkType.COMPLETE:
+                return CompleteTopology(n)
+        
         if nt == NetworkType.LATTICE_2D_RECTANGLE:
             return nx.grid_2d_graph(k_half, k_half, periodic=True)
         elif nt == NetworkType.LATTICE_2D_TRIANGLE:
@@ -69,35 +371,90 @@ class NetworkEnsembleFactory:
         elif nt == NetworkType.WATTS_STROGATZ:
             return nx.watts_strogatz_graph(n,
                                            k=self.params[NetworkType.WATTS_STROGATZ][0],
-                                           p=self.params[NetworkType.WATTS_STROGATZ][1])
+                                           p=self.params[NetworkType.WATTS_STROGATZ][1],
+                                           seed=seed)
         elif nt == NetworkType.POWER_LAW:
             return nx.powerlaw_cluster_graph(n,
                                              m=self.params[NetworkType.POWER_LAW][0],
-                                             p=self.params[NetworkType.POWER_LAW][1])
+                                             p=self.params[NetworkType.POWER_LAW][1],
+                                             seed=seed)
         elif nt == NetworkType.HYPER_CUBE:
             return nx.hypercube_graph(int(math.log2(n)))
         elif nt == NetworkType.ERDOS_RENYI:
-            return nx.erdos_renyi_graph(n, p=self.params[NetworkType.ERDOS_RENYI][0])
+            return nx.erdos_renyi_graph(n, p=self.params[NetworkType.ERDOS_RENYI][0], seed=seed)
         elif nt == NetworkType.BARABASI_ALBERT:
-            return nx.barabasi_albert_graph(n, m=self.params[NetworkType.BARABASI_ALBERT][0])
+            return nx.barabasi_albert_graph(n, m=self.params[NetworkType.BARABASI_ALBERT][0], seed=seed)
         else:
             raise ValueError
         
 class NetworkUtil:
     
     @staticmethod
-    def make_rosetta(network: nx.Graph):
+    def is_complete(network: nx.Graph):
         '''
-        This method output two maps to translate between agent ids and
-        network nodes.
+        Whether every agent is a neighbor of every other, in which case the models replace
+        neighbor reads by mean-field updates from the global counts
         '''
-        n_to_node = {}
-        node_to_n = {}
+        if 'complete' not in network.graph:
+            n = network.number_of_nodes()
+            
+            if isinstance(network, ImplicitTopology):
+                network.graph['complete'] = n > 1 and network.number_of_edges() == n * (n - 1) // 2
+            else:
+                network.graph['complete'] = n > 1 and not network.is_directed() and \
+                    nx.number_of_selfloops(network) == 0 and network.number_of_edges() == n * (n - 1) // 2
+            
+        return network.graph['complete']
+    
+    @staticmethod
+    def make_csr(network: nx.Graph):
+        '''
+        This method outputs a compact integer adjacency in CSR form: the neighbors of
+        agent i are indices[indptr[i]:indptr[i+1]], and degree[i] is their count. Agent
+        ids are the positions of the nodes in the network, and neighbors keep the order of
+        the network adjacency. The arrays are cached per network, while the translation of nodes to
+        agent ids is not kept.
+        '''
+        if 'csr' in network.graph:
+            return network.graph['csr']
         
-        nodes = network.nodes
-
-        for i, node in enumerate(nodes):
-            n_to_node[i] = node
-            node_to_n[node] = i
+        if isinstance(network, ImplicitTopology):
+            network.graph['csr'] = network.csr()
             
-        return n_to_node, node_to_n
\ No newline at end of file
+            return network.graph['csr']
+        
+        node_to_n = {node: i for i, node in enumerate(network.nodes)}
+        n = len(node_to_n)
+        
+        degree = np.zeros(n, dtype=np.int32)
+        indices = []
+        
+        for i, node in enumerate(network.nodes):
+            neighbors = [node_to_n[neighbor] for neighbor in network.adj[node]]
+            degree[i] = len(neighbors)
+            indices.extend(neighbors)
+            
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        indices = np.array(indices, dtype=np.int32)
+        
+        network.graph['csr'] = (indptr, indices, degree)
+        
+        return indptr, indices, degree
+    
+    @staticmethod
+    def make_adjacency(network: nx.Graph):
+        '''
+        This method outputs the unweighted adjacency of the network as a sparse matrix over
+        agent ids, built from (and cached alongside) the CSR arrays.
+        '''
+        if 'adjacency' in network.graph:
+            return network.graph['adjacency']
+        
+        indptr, indices, degree = NetworkUtil.make_csr(network)
+        n = len(degree)
+        adjacency = sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n, n))
+        
+        network.graph['adjacency'] = adjacency
+        
+        return adjacency
\ No newline at end of file
@@ -0,0 +1,208 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import os
+import glob
+
+from csssa2022.storage import StorageBackend
+from csssa2022.record import Record
+from csssa2022.simulation import Simulation
+from csssa2022.summary import Summary
+from csssa2022.snapshot import Snapshot
+from csssa2022.cycle import Cycle
+
+# The columnar backend is optional
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class ParquetStorage(StorageBackend):
+    '''
+    Columnar storage backend. Each table is a directory of Parquet files partitioned by
+    experiment and ensemble point (table/uuid_exp=.../ensemble_id=.../data.parquet), as
+    read by pyarrow.dataset or arrow::open_dataset. Rows of an ensemble point are kept in
+    memory and written as one file when it is marked complete, so worker processes can
+    write their own ensemble points and a summaries file marks a complete ensemble point.
+    '''
+    
+    concurrent = True
+    
+    # Rows per row group, large enough to hold any ensemble point in a single one
+    row_group_size = 1 << 20
+    
+    def __init__(self, directory, durable=False):
+        if pa is None:
+            raise ImportError('The Parquet storage backend requires pyarrow')
+        
+        self.directory = directory
+        self.durable = durable
+        self.buffers = {}
+        
+        self.schemas = {
+            'records': pa.schema([('step_id', pa.int64()), ('agent_id', pa.int64()),
+                                  ('opinion', pa.int8()), ('f_val', pa.float64())]),
+            'summaries': pa.schema([('step_id', pa.int64()), ('total_yes', pa.int64()),
+                                    ('total_no', pa.int64()), ('avg_f', pa.float64()),
+                                    ('conv_step', pa.int64())]),
+            'snapshots': pa.schema([('step_id', pa.int64()), ('n', pa.int64()),
+                                    ('opinions', pa.binary()), ('f_vals', pa.binary())]),
+            'cycles': pa.schema([('step_id', pa.int64()), ('length', pa.int64())])
+        }
+    
+    def connect(self):
+        for table in ['simulations'] + list(self.schemas):
+            os.makedirs(os.path.join(self.directory, table), exist_ok=True)
+    
+    def partition(self, table, uuid_exp, ensemble_id):
+        return os.path.join(self.directory, table, f'uuid_exp={uuid_exp}', f'ensemble_id={ensemble_id}')
+    
+    def write(self, table, path):
+        '''
+        Writes a file under a temporary name and renames it, so readers never see a
+        partial file
+        '''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        
+        pq.write_table(table, temporary, compression='zstd', row_group_size=self.row_group_size)
+        
+        if self.durable:
+            with open(temporary, 'rb') as f:
+                os.fsync(f.fileno())
+        
+        os.replace(temporary, path)
+    
+    def buffer(self, table, uuid_exp, ensemble_id, row):
+        self.buffers.setdefault((table, uuid_exp, ensemble_id), []).append(row)
+    
+    def insert_simulation(self, s: Simulation):
+        values = {
+            'uuid_exp': [s.uuid_exp],
+            'ensemble_size': [s.ensemble_size],
+            'n': [s.n],
+            'simulation_type': [str(s.simulation_type.value)],
+            'interaction_type': [str(s.interaction_type.value)],
+            'interactants': [s.interactants],
+            'initial_state': [float(s.initial_state)],
+            'network_type': [str(s.network_type.value)],
+            'max_steps': [s.max_steps]
+        }
+        
+        self.write(pa.table(values), os.path.join(self.directory, 'simulations', f'{s.uuid_exp}.parquet'))
+    
+    def insert_record(self, r: Record):
+        self.buffer('records', r.uuid_exp, r.ensemble_id, (r.step_id, r.agent_id, r.opinion, r.f_val))
+    
+    def insert_summary(self, s: Summary):
+        self.buffer('summaries', s.uuid_exp, s.ensemble_id, (s.step_id, s.total_yes, s.total_no, s.avg_f, s.conv_step))
+    
+    def insert_snapshot(self, s: Snapshot):
+        self.buffer('snapshots', s.uuid_exp, s.ensemble_id, (s.step_id, s.n, s.opinions, s.f_vals))
+    
+    def insert_cycle(self, c: Cycle):
+        self.buffer('cycles', c.uuid_exp, c.ensemble_id, (c.step_id, c.length))
+    
+    def insert_member(self, uuid_exp, ensemble_id):
+        '''
+        Writes the rows of a complete ensemble point, its summaries last as they mark it
+        as complete
+        '''
+        for table in ['records', 'snapshots', 'cycles', 'summaries']:
+            rows = self.buffers.pop((table, uuid_exp, ensemble_id), [])
+            
+            if len(rows) > 0 or table == 'summaries':
+                schema = self.schemas[table]
+                columns = zip(*rows) if len(rows) > 0 else [[] for _ in schema]
+                
+                self.write(pa.Table.from_pydict(dict(zip(schema.names, map(list, columns))), schema=schema),
+                           os.path.join(self.partition(table, uuid_exp, ensemble_id), 'data.parquet'))
+    
+    def has_simulation(self, uuid_exp):
+        return os.path.isfile(os.path.join(self.directory, 'simulations', f'{uuid_exp}.parquet'))
+    
+    def read_simulation(self, uuid_exp):
+        return pq.read_table(os.path.join(self.directory, 'simulations', f'{uuid_exp}.parquet')).to_pylist()[0]
+    
+    def read_members(self, uuid_exp):
+        paths = glob.glob(os.path.join(self.partition('summaries', uuid_exp, '*'), 'data.parquet'))
+        
+        return set(int(os.path.basename(os.path.dirname(p)).split('=')[1]) for p in paths)
+    
+    def discard_incomplete(self, uuid_exp):
+        '''
+        Deletes the files of interrupted writes and of ensemble points without summaries
+        '''
+        completed = self.read_members(uuid_exp)
+        
+        for table in self.schemas:
+            for path in glob.glob(os.path.join(self.partition(table, uuid_exp, '*'), '*')):
+                ensemble_id = int(os.path.basename(os.path.dirname(path)).split('=')[1])
+                
+                if path.endswith('.tmp') or ensemble_id not in completed:
+                    os.remove(path)
+    
+    def read_table(self, table, uuid_exp, ensemble_id):
+        return pq.read_table(os.path.join(self.partition(table, uuid_exp, ensemble_id), 'data.parquet')).to_pylist()
+    
+    def read_summaries(self, uuid_exp, filled=True):
+        '''
+        Reads the summaries of an experiment ordered by ensemble point and step. With filled,
+        every ensemble point is padded with its last summary up to max_steps.
+        '''
+        max_steps = int(self.read_simulation(uuid_exp)['max_steps'])
+        summaries = []
+        
+        for ensemble_id in sorted(self.read_members(uuid_exp)):
+            rows = [Summary(uuid_exp, ensemble_id, **row) for row in self.read_table('summaries', uuid_exp, ensemble_id)]
+            
+            if filled and len(rows) > 0:
+                last = rows[-1]
+                
+                for s in range(last.step_id + 1, max_steps + 1):
+                    rows.append(Summary(uuid_exp, ensemble_id, s, last.total_yes, last.total_no,
+                                        last.avg_f, last.conv_step))
+            
+            summaries.extend(sorted(rows, key=lambda r: r.step_id))
+        
+        return summaries
+    
+    def read_snapshots(self, uuid_exp, ensemble_id=None):
+        members = sorted(self.read_members(uuid_exp)) if ensemble_id is None else [ensemble_id]
+        snapshots = []
+        
+        for e in members:
+            if os.path.isfile(os.path.join(self.partition('snapshots', uuid_exp, e), 'data.parquet')):
+                rows = [Snapshot(uuid_exp, e, **row) for row in self.read_table('snapshots', uuid_exp, e)]
+                snapshots.extend(sorted(rows, key=lambda r: r.step_id))
+        
+        return snapshots
+    
+    def read_cycles(self, uuid_exp):
+        cycles = []
+        
+        for e in sorted(self.read_members(uuid_exp)):
+            if os.path.isfile(os.path.join(self.partition('cycles', uuid_exp, e), 'data.parquet')):
+                cycles.extend(Cycle(uuid_exp, e, **row) for row in self.read_table('cycles', uuid_exp, e))
+        
+        return cycles
+    
+    def materialize(self, uuid_exp):
+        '''
+        Columnar files are scanned by the analysis directly, there is nothing to aggregate
+        '''
+        pass
+    
+    def checkpoint(self):
+        '''
+        Ensemble points are written as they are marked complete
+        '''
+        pass
+    
+    def close(self):
+        self.buffers = {}
\ No newline at end of file
@@ -0,0 +1,32 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import array
+import random
+
+
+class RandomSequentialScheduler:
+    '''
+    Activates every agent once per step in random order, as mesa.time.RandomActivation does,
+    over integer agent ids instead of agent objects. The order is reshuffled in place from
+    the previous one with the generator of the model, so the same generator gives the same
+    activation sequence as Mesa. Typed arrays of agent ids are kept as they are, lists are
+    copied.
+    '''
+    __slots__ = ('order', 'random', 'steps')
+    
+    def __init__(self, order: list, rng: random.Random):
+        self.order = order if isinstance(order, array.array) else list(order)
+        self.random = rng
+        self.steps = 0
+    
+    def step(self):
+        '''
+        Returns the activation order of the next step
+        '''
+        self.random.shuffle(self.order)
+        self.steps += 1
+        
+        return self.order
\ No newline at end of file
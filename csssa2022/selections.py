@@ -23,4 +23,61 @@ class InteractionType(Enum):
     
 class SimulationType(Enum):
     MATRIX = 'matrix'
-    ABM = 'abm'
\ No newline at end of file
+    ABM = 'abm'
+    
+class EngineType(Enum):
+    PYTHON = 'python'
+    SPARSE = 'sparse'
+    NATIVE = 'native'
+    
+class BackendType(Enum):
+    SQLITE = 'sqlite'
+    PARQUET = 'parquet'
+    
+class ConvergenceType(Enum):
+    QUEUE = 'queue'
+    FINGERPRINT = 'fingerprint'
+
+# Command line and configuration names of the selections
+network_opts_map = {
+    'l2dr': NetworkType.LATTICE_2D_RECTANGLE,
+    'l2dt': NetworkType.LATTICE_2D_TRIANGLE,
+    'l2dh': NetworkType.LATTICE_2D_HEXAGON,
+    'k_n': NetworkType.COMPLETE,
+    'ws': NetworkType.WATTS_STROGATZ,
+    'pl': NetworkType.POWER_LAW,
+    'hc': NetworkType.HYPER_CUBE,
+    'er': NetworkType.ERDOS_RENYI, 
+    'ba': NetworkType.BARABASI_ALBERT
+}
+
+interaction_opts_map = {
+    'dyn': InteractionType.DYADIC,
+    'hord': InteractionType.HIGHER_ORDER
+}
+
+simulation_opts_map = {
+    'matrix': SimulationType.MATRIX,
+    'sparse': SimulationType.MATRIX,
+    'abm': SimulationType.ABM,
+    'native': SimulationType.ABM
+}
+
+# Engines implementing the same simulation type, e.g., sparse produces matrix results and
+# native produces ABM results without Mesa
+engine_opts_map = {
+    'matrix': EngineType.PYTHON,
+    'sparse': EngineType.SPARSE,
+    'abm': EngineType.PYTHON,
+    'native': EngineType.NATIVE
+}
+
+backend_opts_map = {
+    'sqlite': BackendType.SQLITE,
+    'parquet': BackendType.PARQUET
+}
+
+convergence_opts_map = {
+    'queue': ConvergenceType.QUEUE,
+    'fingerprint': ConvergenceType.FINGERPRINT
+}
\ No newline at end of file
@@ -0,0 +1,37 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import numpy as np
+
+from dataclasses import dataclass
+
+
+@dataclass
+class Snapshot:
+    '''
+    Class that represents the state of all agents at one step. Opinions are stored as a
+    bit-packed blob and the values of f as a float32 blob, both indexed by agent id.
+    '''
+    uuid_exp: str
+    ensemble_id: int
+    step_id: int
+    n: int
+    opinions: bytes
+    f_vals: bytes
+    
+    @staticmethod
+    def from_arrays(uuid_exp, ensemble_id, step_id, opinions, f_vals):
+        return Snapshot(uuid_exp,
+                        ensemble_id,
+                        step_id,
+                        len(opinions),
+                        np.packbits(np.asarray(opinions, dtype=bool)).tobytes(),
+                        np.asarray(f_vals, dtype='<f4').tobytes())
+    
+    def opinion_array(self):
+        return np.unpackbits(np.frombuffer(self.opinions, dtype=np.uint8), count=self.n).astype(np.int8)
+    
+    def f_array(self):
+        return np.frombuffer(self.f_vals, dtype='<f4')
\ No newline at end of file
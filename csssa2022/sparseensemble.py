@@ -0,0 +1,69 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import time
+import numpy as np
+
+
+class DyadicSparseEnsemble:
+    '''
+    This class advances several ensemble points of a DyadicSparseVoterModel that share one
+    network together. Their opinion vectors are the columns of an n x E state matrix, so a
+    single sparse product per step serves all members that have not converged yet. Each
+    member keeps its own convergence test and summaries.
+    '''
+    
+    def __init__(self, models: list):
+        self.models = models
+        self.stepper = models[0]
+        
+        # Stack the members in column-major matrices and turn their stores into views
+        shape = (self.stepper.n, len(models))
+        self.agent_states = np.zeros(shape, dtype=np.int8, order='F')
+        self.agent_fs = np.zeros(shape, dtype=self.stepper.f_dtype, order='F')
+        
+        for j, model in enumerate(models):
+            self.agent_states[:, j] = model.agent_states
+            self.agent_fs[:, j] = model.agent_fs
+            model.agent_states = self.agent_states[:, j]
+            model.agent_fs = self.agent_fs[:, j]
+    
+    def step(self, members):
+        '''
+        Computes one synchronous step for the given member columns only
+        '''
+        if len(members) == len(self.models):
+            states = self.agent_states
+        else:
+            states = self.agent_states[:, members]
+        
+        fs = self.stepper.compute_fs(states)
+        
+        self.agent_fs[:, members] = fs
+        self.agent_states[:, members] = fs > self.stepper.f_threshold
+        
+        for j in members:
+            self.models[j].recount_totals()
+    
+    def run(self):
+        while any(model.running for model in self.models):
+            # Converged members and members at their last step drop out of the product
+            members = [j for j, model in enumerate(self.models)
+                       if model.running and not(model.converged) and model.stepno != model.max_steps]
+            
+            # The time of a shared step is split among the members it advanced
+            if len(members) > 0:
+                start = time.perf_counter()
+                self.step(members)
+                elapsed = (time.perf_counter() - start) / len(members)
+                
+                for j in members:
+                    self.models[j].timer.add('step', elapsed)
+            
+            stepped = set(members)
+            
+            for j, model in enumerate(self.models):
+                if model.running:
+                    model.advance(stepped=(j in stepped))
\ No newline at end of file
@@ -0,0 +1,85 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+from abc import ABC, abstractmethod
+from csssa2022.record import Record
+from csssa2022.simulation import Simulation
+from csssa2022.summary import Summary
+from csssa2022.snapshot import Snapshot
+from csssa2022.cycle import Cycle
+
+
+class StorageBackend(ABC):
+    '''
+    Interface of the outputs of the models and the model driver. Rows of an ensemble point
+    are complete once insert_member marks it, and durable after the next checkpoint.
+    '''
+    
+    # Whether several processes may write to the same storage at once
+    concurrent = False
+    
+    @abstractmethod
+    def connect(self):
+        pass
+    
+    @abstractmethod
+    def insert_simulation(self, s: Simulation):
+        pass
+    
+    @abstractmethod
+    def insert_record(self, r: Record):
+        pass
+    
+    @abstractmethod
+    def insert_summary(self, s: Summary):
+        pass
+    
+    @abstractmethod
+    def insert_snapshot(self, s: Snapshot):
+        pass
+    
+    @abstractmethod
+    def insert_cycle(self, c: Cycle):
+        pass
+    
+    @abstractmethod
+    def insert_member(self, uuid_exp, ensemble_id):
+        pass
+    
+    @abstractmethod
+    def has_simulation(self, uuid_exp):
+        pass
+    
+    @abstractmethod
+    def read_members(self, uuid_exp):
+        pass
+    
+    @abstractmethod
+    def discard_incomplete(self, uuid_exp):
+        pass
+    
+    @abstractmethod
+    def read_summaries(self, uuid_exp, filled=True):
+        pass
+    
+    @abstractmethod
+    def read_snapshots(self, uuid_exp, ensemble_id=None):
+        pass
+    
+    @abstractmethod
+    def read_cycles(self, uuid_exp):
+        pass
+    
+    @abstractmethod
+    def materialize(self, uuid_exp):
+        pass
+    
+    @abstractmethod
+    def checkpoint(self):
+        pass
+    
+    @abstractmethod
+    def close(self):
+        pass
\ No newline at end of file
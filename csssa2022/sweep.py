@@ -0,0 +1,279 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import json
+import uuid
+import random
+import itertools
+import numpy as np
+
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from csssa2022.database import RowCollector
+from csssa2022.storage import StorageBackend
+from csssa2022.instrumentation import PhaseTimer
+from csssa2022.simulation import Simulation
+from csssa2022.network import NetworkEnsembleFactory, NetworkCache
+from csssa2022.modeldriver import ModelDriver
+from csssa2022.selections import SimulationType, InteractionType, NetworkType, EngineType, BackendType, ConvergenceType
+from csssa2022.selections import network_opts_map, interaction_opts_map, simulation_opts_map, engine_opts_map, backend_opts_map
+from csssa2022.selections import convergence_opts_map
+
+
+@dataclass
+class Job:
+    '''
+    Class that represents one experiment of a sweep, i.e., one line of a model runner script.
+    '''
+    simulation: SimulationType
+    interaction: InteractionType
+    network: NetworkType
+    interactants: int
+    n: int
+    max_steps: int
+    ensemble_size: int
+    initial_state: float
+    engine: EngineType
+    uuid_exp: str = None
+
+
+class SweepRunner:
+    '''
+    This class runs a whole parameter sweep in one process and a local worker pool. Jobs
+    sharing a network ensemble are grouped, so each network is generated once and every
+    job of the group runs on it. The parent process is the only database writer.
+    '''
+    
+    # Parameters of a job, named as the arguments of main.py
+    keys = ['simulation', 'interaction', 'network', 'interactants', 'n', 'maxsteps', 'ensemble', 'initialmag']
+    
+    # Configuration entries of the runner itself
+    settings = ['filename', 'workers', 'seed', 'compact', 'durable', 'implicit', 'cache', 'resume', 'snapshots',
+                'backend', 'timings', 'frontier', 'convergence', 'compact_state']
+    
+    def __init__(self, jobs: list, filename, workers=1, seed=None, compact=False, durable=False, implicit=False,
+                 cache: NetworkCache = None, resume=False, snapshots=None, backend: BackendType = BackendType.SQLITE,
+                 timings=None, frontier=False, convergence: ConvergenceType = ConvergenceType.QUEUE,
+                 compact_state=False):
+        self.jobs = jobs
+        self.filename = filename
+        self.workers = workers
+        self.seed = seed
+        self.compact = compact
+        self.durable = durable
+        self.implicit = implicit
+        self.cache = cache
+        self.resume = resume
+        self.snapshots = snapshots
+        self.backend = backend
+        self.timings = timings
+        self.frontier = frontier
+        self.convergence = convergence
+        self.compact_state = compact_state
+    
+    @staticmethod
+    def load(path, **kwargs):
+        '''
+        Reads a JSON sweep configuration. Jobs come from the cartesian product of the lists
+        in "grid" and from the explicit entries of "jobs", both completed by "defaults".
+        Other top level entries (see settings) configure the runner and can be overridden
+        with keyword arguments. The cache is the directory of a NetworkCache, and the
+        backend and convergence are names of selections, and cache_size bounds the cache
+        in MB.
+        '''
+        with open(path) as f:
+            config = json.load(f)
+        
+        defaults = config.get('defaults', {})
+        entries = []
+        
+        if 'grid' in config:
+            grid = dict(defaults, **config['grid'])
+            values = [v if isinstance(v, list) else [v] for v in (grid[k] for k in SweepRunner.keys)]
+            
+            for combination in itertools.product(*values):
+                entries.append(dict(zip(SweepRunner.keys, combination)))
+        
+        for entry in config.get('jobs', []):
+            entries.append(dict(defaults, **entry))
+        
+        jobs = [SweepRunner.make_job(entry) for entry in entries]
+        
+        options = {k: config[k] for k in SweepRunner.settings if k in config}
+        options.update({k: v for k, v in kwargs.items() if v is not None})
+        
+        if options.get('filename') is None:
+            raise ValueError('A sweep needs a database filename, in the configuration or as an argument')
+        
+        if options.get('snapshots') is not None and options['snapshots'] < 1:
+            raise ValueError(f'Snapshots are stored every positive number of steps, got {options["snapshots"]}')
+        
+        cache_size = options.pop('cache_size', config.get('cache_size', 4096))
+        
+        if isinstance(options.get('cache'), str):
+            options['cache'] = NetworkCache(options['cache'], cache_size * 1024**2)
+            
+        if isinstance(options.get('backend'), str):
+            options['backend'] = backend_opts_map[options['backend']]
+        
+        if isinstance(options.get('convergence'), str):
+            options['convergence'] = convergence_opts_map[options['convergence']]
+        
+        return SweepRunner(jobs, **options)
+    
+    @staticmethod
+    def make_job(entry):
+        return Job(simulation_opts_map[entry['simulation']],
+                   interaction_opts_map[entry['interaction']],
+                   network_opts_map[entry['network']],
+                   int(entry['interactants']),
+                   int(entry['n']),
+                   int(entry['maxsteps']),
+                   int(entry['ensemble']),
+                   float(entry['initialmag']),
+                   engine_opts_map[entry['simulation']])
+    
+    def make_groups(self):
+        '''
+        Groups jobs by network ensemble, preserving the order of the sweep
+        '''
+        groups = {}
+        
+        for job in self.jobs:
+            groups.setdefault((job.network, job.n, job.ensemble_size), []).append(job)
+        
+        return list(groups.values())
+    
+    @staticmethod
+    def run_group_member(group, ensemble_id, seeds, compact, implicit=False, cache: NetworkCache = None,
+                         snapshots=None, storage: StorageBackend = None, frontier=False,
+                         convergence: ConvergenceType = ConvergenceType.QUEUE, compact_state=False):
+        '''
+        Computes one ensemble point of every job in a group on a single network. Seeds are
+        those of ModelDriver.run_model, so each job gives the same results as main.py
+        with the same seed. As in ModelDriver.run_member, rows are only returned when no
+        storage backend allowing concurrent writers is given. Every job gives a pair of its
+        rows and timings, the shared network being timed with the first job.
+        '''
+        network_seed, model_seed = seeds
+        timers = [PhaseTimer() for _ in group]
+        
+        with timers[0].phase('network'):
+            net = NetworkEnsembleFactory(implicit=implicit, cache=cache).make_member(group[0].n, group[0].network, seed=network_seed)
+        
+        outcomes = []
+        
+        for job, timer in zip(group, timers):
+            random.seed(model_seed)
+            rows = RowCollector() if storage is None else storage
+            model = ModelDriver.make_model(job.simulation, job.interaction, job.engine, job.uuid_exp,
+                                           ensemble_id, job.interactants, job.initial_state, net,
+                                           job.n, job.max_steps, rows, stop_on_convergence=compact,
+                                           snapshot_interval=snapshots, frontier=frontier,
+                                           convergence=convergence, compact_state=compact_state, timer=timer)
+            
+            # Save the initial values and run the model
+            model.save_all()
+            model.run()
+            
+            if storage is None:
+                outcomes.append((rows, timer))
+            else:
+                with timer.phase('commit'):
+                    storage.insert_member(job.uuid_exp, ensemble_id)
+                    storage.checkpoint()
+                
+                outcomes.append((None, timer))
+        
+        return outcomes
+    
+    def run(self):
+        '''
+        Runs every job of the sweep. With resume, jobs get the uuids ModelDriver gives to
+        resumed experiments, and only the ensemble points missing from the database are
+        computed.
+        '''
+        if self.resume and self.seed is None:
+            raise ValueError('Resuming a sweep requires its seed')
+        
+        # Every job shares the seed of the sweep, drawn if not given
+        if self.seed is None:
+            self.seed = np.random.SeedSequence().entropy
+        
+        print(f'Sweep: {len(self.jobs)} jobs - Seed: {self.seed}')
+        
+        db = ModelDriver.make_storage(self.backend, self.filename, durable=self.durable)
+        db.connect()
+        
+        # Register all experiments up front, and find the computed ensemble points on resume
+        completed = {}
+        
+        for job in self.jobs:
+            if self.resume:
+                job.uuid_exp = ModelDriver.make_uuid(job.simulation, job.interaction, job.network,
+                                                     job.interactants, job.n, job.max_steps,
+                                                     job.ensemble_size, job.initial_state, job.engine,
+                                                     self.compact, self.implicit, self.seed,
+                                                     frontier=self.frontier, convergence=self.convergence,
+                                                     compact_state=self.compact_state)
+            else:
+                job.uuid_exp = str(uuid.uuid1())
+            
+            if self.resume and db.has_simulation(job.uuid_exp):
+                completed[job.uuid_exp] = db.read_members(job.uuid_exp)
+                db.discard_incomplete(job.uuid_exp)
+            else:
+                completed[job.uuid_exp] = set()
+                db.insert_simulation(Simulation(job.uuid_exp, job.ensemble_size, job.n, job.simulation,
+                                                job.interaction, job.interactants, job.initial_state,
+                                                job.network, job.max_steps))
+        db.checkpoint()
+        
+        # One task per group and ensemble point, with the jobs still missing that point
+        tasks = []
+        
+        for group in self.make_groups():
+            seeds = ModelDriver.make_seeds(self.seed, group[0].ensemble_size)
+            
+            for i in range(0, group[0].ensemble_size):
+                jobs = [job for job in group if i not in completed[job.uuid_exp]]
+                
+                if len(jobs) > 0:
+                    tasks.append((jobs, i, seeds[i]))
+        
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ModelDriver.pool_context()) as pool:
+            futures = [pool.submit(SweepRunner.run_group_member, group, i, seeds, self.compact,
+                                   self.implicit, self.cache, self.snapshots,
+                                   db if db.concurrent else None, self.frontier, self.convergence,
+                                   self.compact_state)
+                       for group, i, seeds in tasks]
+            
+            for (group, i, _), future in zip(tasks, futures):
+                outcomes = future.result()
+                
+                # Workers storing their own rows return none, the commit is timed with the
+                # first job
+                with outcomes[0][1].phase('commit'):
+                    for job, (rows, _) in zip(group, outcomes):
+                        if rows is not None:
+                            rows.write(db)
+                            db.insert_member(job.uuid_exp, i)
+                    
+                    # Commit the outcomes of the current ensemble point
+                    db.checkpoint()
+                
+                if self.timings is not None:
+                    for job, (_, timer) in zip(group, outcomes):
+                        timer.write(self.timings, job.uuid_exp, i)
+                
+                print(f'Computed ensemble point {i} - {group[0].network.value}, S: {group[0].n}, {len(group)} jobs')
+        
+        # Aggregate every experiment for the analysis
+        for job in self.jobs:
+            db.materialize(job.uuid_exp)
+        
+        db.close()
+        
+        print('Sweep computed')
\ No newline at end of file
@@ -5,30 +5,12 @@
 # and is available at https://www.mozilla.org/en-US/MPL/2.0/
 import click
 
-from csssa2022.selections import NetworkType, InteractionType, SimulationType
+from functools import partial
+from csssa2022.selections import network_opts_map, interaction_opts_map, simulation_opts_map, engine_opts_map, backend_opts_map
+from csssa2022.selections import convergence_opts_map
+from csssa2022.network import NetworkCache
 from csssa2022.modeldriver import ModelDriver
-
-network_opts_map = {
-    'l2dr': NetworkType.LATTICE_2D_RECTANGLE,
-    'l2dt': NetworkType.LATTICE_2D_TRIANGLE,
-    'l2dh': NetworkType.LATTICE_2D_HEXAGON,
-    'k_n': NetworkType.COMPLETE,
-    'ws': NetworkType.WATTS_STROGATZ,
-    'pl': NetworkType.POWER_LAW,
-    'hc': NetworkType.HYPER_CUBE,
-    'er': NetworkType.ERDOS_RENYI, 
-    'ba': NetworkType.BARABASI_ALBERT
-}
-
-interaction_opts_map = {
-    'dyn': InteractionType.DYADIC,
-    'hord': InteractionType.HIGHER_ORDER
-}
-
-simulation_opts_map = {
-    'matrix': SimulationType.MATRIX,
-    'abm': SimulationType.ABM
-}
+from csssa2022.instrumentation import profile_call
 
 @click.command()
 @click.argument('simulation', required=1, type=click.STRING)
@@ -40,10 +22,29 @@ simulation_opts_map = {
 @click.argument('ensemble', required=1, type=click.INT)
 @click.argument('initialmag', required=1, type=click.FLOAT)
 @click.argument('filename', required=1)
+@click.option('--batch', is_flag=True, help='Advance all ensemble points together (sparse dyadic, fixed networks)')
+@click.option('--compact', is_flag=True, help='End each run at convergence instead of at maxsteps')
+@click.option('--durable', is_flag=True, help='Commit every database row as it is written')
+@click.option('--workers', default=1, type=click.INT, help='Number of processes computing ensemble points')
+@click.option('--seed', default=None, type=click.INT, help='Seed of the experiment, random if not given')
+@click.option('--implicit', is_flag=True, help='Compute lattice, hypercube and complete neighbors instead of building graphs')
+@click.option('--cache', default=None, type=click.Path(file_okay=False), help='Directory where generated networks are stored and reused')
+@click.option('--cache-size', default=4096, type=click.INT, help='Size bound of the network cache in MB')
+@click.option('--resume', is_flag=True, help='Only compute the ensemble points missing from the database (requires --seed)')
+@click.option('--snapshots', default=None, type=click.IntRange(min=1), help='Store the states of all agents every given number of steps')
+@click.option('--backend', default='sqlite', type=click.Choice(list(backend_opts_map)), help='Storage backend, parquet writes a directory at filename')
+@click.option('--timings', default=None, type=click.Path(dir_okay=False), help='Append the time spent in each phase of every ensemble point to this JSON lines file')
+@click.option('--profile', default=None, type=click.Path(dir_okay=False), help='Run under cProfile and tracemalloc and write the profile to this file')
+@click.option('--frontier', is_flag=True, help='Only recompute agents next to opinion changes (matrix dyadic)')
+@click.option('--convergence', default='queue', type=click.Choice(list(convergence_opts_map)), help='Convergence test, fingerprint detects repeated states and cycles')
+@click.option('--compact-state', is_flag=True, help='Store opinions in one byte and f in single precision, for populations of millions')
 def main(simulation, interaction, network, interactants, n, 
-         maxsteps, ensemble, initialmag, filename):
+         maxsteps, ensemble, initialmag, filename, batch, compact, durable, workers, seed, implicit,
+         cache, cache_size, resume, snapshots, backend, timings, profile, frontier, convergence,
+         compact_state):
     md = ModelDriver()
-    md.run_model(
+    run_model = md.run_model if profile is None else partial(profile_call, profile, md.run_model)
+    run_model(
         simulation_opts_map[simulation],
         interaction_opts_map[interaction],
         network_opts_map[network],
@@ -52,7 +53,22 @@ def main(simulation, interaction, network, interactants, n,
         maxsteps,
         ensemble,
         initialmag,
-        filename
+        filename,
+        engine=engine_opts_map[simulation],
+        batch=batch,
+        compact=compact,
+        durable=durable,
+        workers=workers,
+        seed=seed,
+        implicit=implicit,
+        cache=None if cache is None else NetworkCache(cache, cache_size * 1024**2),
+        resume=resume,
+        snapshots=snapshots,
+        backend=backend_opts_map[backend],
+        timings=timings,
+        frontier=frontier,
+        convergence=convergence_opts_map[convergence],
+        compact_state=compact_state
     )
 
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# Materialize the aggregates of experiments that lack them
+python materialize.py csssa2022.db
+
 # Run the R script generating images
 Rscript analysis.R
 
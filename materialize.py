@@ -0,0 +1,20 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import click
+
+from csssa2022.database import Database
+
+@click.command()
+@click.argument('filename', required=1, type=click.Path(exists=True))
+@click.option('--rebuild', is_flag=True, help='Rebuild the aggregates of every experiment, not only the missing ones')
+def main(filename, rebuild):
+    db = Database(filename)
+    db.connect()
+    db.materialize_all(rebuild=rebuild)
+    db.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
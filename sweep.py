@@ -0,0 +1,26 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import click
+
+from csssa2022.sweep import SweepRunner
+
+@click.command()
+@click.argument('config', required=1, type=click.Path(exists=True))
+@click.option('--filename', default=None, help='Database file, overrides the configuration')
+@click.option('--workers', default=None, type=click.INT, help='Number of worker processes, overrides the configuration')
+@click.option('--seed', default=None, type=click.INT, help='Seed of the sweep, overrides the configuration')
+@click.option('--cache', default=None, type=click.Path(file_okay=False), help='Network cache directory, overrides the configuration')
+@click.option('--cache-size', default=None, type=click.INT, help='Size bound of the network cache in MB, overrides the configuration')
+@click.option('--resume/--no-resume', default=None, help='Only compute the ensemble points missing from the database, overrides the configuration')
+@click.option('--backend', default=None, type=click.Choice(['sqlite', 'parquet']), help='Storage backend, overrides the configuration')
+@click.option('--timings', default=None, type=click.Path(dir_okay=False), help='JSON lines file of the time spent in each phase, overrides the configuration')
+def main(config, filename, workers, seed, cache, cache_size, resume, backend, timings):
+    sr = SweepRunner.load(config, filename=filename, workers=workers, seed=seed, cache=cache, cache_size=cache_size,
+                          resume=resume, backend=backend, timings=timings)
+    sr.run()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
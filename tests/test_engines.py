@@ -0,0 +1,53 @@
+# Copyright (c) 2022 SPEC collaborative. All rights reserved.
+#
+# This program and the accompanying materials are made available under the
+# terms of the Mozilla Public License v2.0 which accompanies this distribution,
+# and is available at https://www.mozilla.org/en-US/MPL/2.0/
+import sqlite3
+import pytest
+
+from csssa2022.modeldriver import ModelDriver
+from csssa2022.selections import SimulationType, InteractionType, NetworkType, EngineType
+
+
+def run_summaries(path, engine, nt, initial_state=0.45, **kwargs):
+    '''
+    Runs a small dyadic ensemble and returns its summaries without the experiment id
+    '''
+    ModelDriver.run_model(SimulationType.MATRIX, InteractionType.DYADIC, nt, 2, 64, 40, 4, initial_state,
+                          str(path), engine=engine, seed=7, **kwargs)
+    
+    with sqlite3.connect(path) as con:
+        return con.execute('select ensemble_id, step_id, total_yes, total_no, avg_f, conv_step from summaries '
+                           'order by ensemble_id, step_id').fetchall()
+
+
+@pytest.mark.parametrize('nt', [NetworkType.WATTS_STROGATZ, NetworkType.HYPER_CUBE, NetworkType.ERDOS_RENYI,
+                                NetworkType.BARABASI_ALBERT, NetworkType.POWER_LAW, NetworkType.COMPLETE,
+                                NetworkType.LATTICE_2D_RECTANGLE])
+@pytest.mark.parametrize('options', [{}, {'compact_state': True}])
+def test_sparse_matches_matrix(tmp_path, nt, options):
+    '''
+    The vectorized engine gives exactly the summaries of the matrix model, avg_f included
+    '''
+    matrix = run_summaries(tmp_path / 'matrix.db', EngineType.PYTHON, nt, **options)
+    sparse = run_summaries(tmp_path / 'sparse.db', EngineType.SPARSE, nt, **options)
+    
+    assert sparse == matrix
+
+
+def test_matrix_queue_convergence_on_cycles(tmp_path):
+    '''
+    On the complete graph with half of the agents saying yes, every step flips all
+    opinions. Both states have the same exact sum of f, so avg_f repeats exactly and the
+    convergence queue fills after the first four steps, whatever the update order
+    '''
+    rows = run_summaries(tmp_path / 'matrix.db', EngineType.PYTHON, NetworkType.COMPLETE, initial_state=0.5)
+    
+    conv_steps = {}
+    
+    for ensemble_id, _, _, _, _, conv_step in rows:
+        conv_steps[ensemble_id] = max(conv_step, conv_steps.get(ensemble_id, 0))
+    
+    assert conv_steps == {0: 4, 1: 4, 2: 4, 3: 4}
+    assert {avg_f for _, step_id, _, _, avg_f, _ in rows if step_id > 0} == {0.5}
\ No newline at end of file